@@ -1,108 +1,363 @@
 import anthropic
 import math
+import os
+import random
+import time
+from plan_cache import PlanCache, relevant_objects
+from scene import DEFAULT_SCENE
+from plan_stream import IncrementalPlanParser
+from plan_validation import TOOL_ARGS, PlanValidationError, extract_plan, validate_plan, validate_step
+import fast_planner
+import tracing
+from llm_client import LLM_TIMEOUT_SECONDS, AsyncLLMClient, LLMDeadlineExceeded
 
 client = anthropic.Anthropic(
     # defaults to os.environ.get("ANTHROPIC_API_KEY")
     api_key="sk-ant-REDACTED",
+    timeout=LLM_TIMEOUT_SECONDS,
 )
-data = [{
-    "Object": "apple",
-    "x": "short",
-    "y": "long",
-    "location": [0.82, -0.3, 0.6849899910813102]
-},
-    {
-    "Object": "bottle",
-    "location": [0.7, 0.1, 0.8],
-    "x": "short",
-    "y": "short"
-},
-    {
-    "Object": "box",
-    "location": [1, 0.1, 0.7],
-    "x": "long",
-    "y": "short"
-},
-    {
-    "Object": "banana",
-    "location": [0.893, 0.313, 0.660],
-    "x": "long",
-    "y": "short"
-},
-    {
-    "Object": "container",
-    "location": [0.9, -0.75, 0.73],
-    "x": "long",
-    "y": "long"
-},
-    {
-    "Object": "hammer",
-    "location": [1, -0.2, 0.7],
-    "x": "short",
-    "y": "long"
-}]
-
-
-def get_response(data, prompt):
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=20000,
-        temperature=1,
-        messages=[
-            {
-                "role": "user",
-                "content": f"""
-                You are in a 3D world. You are a robot arm mounted on a table. You can control the end effector's position and gripper.
-
-                Your goal is to complete the following task:
-                {prompt}
-
-                Numerical scene information:
-                The position is represented by a 3D vector [x, y, z]. The axes are perpendicular to each other.
-                The objects in the current scene are:
-                {data}
-
-                You can use the following functions:
-                - move_arm(position)
-                - open_gripper()
-                - close_gripper()
-
-                You must output a sequence of functions to complete the task. Go up 0.3m each time you pick up an object. Prior to routing to an object, move to a position 0.25m above it. Drop objects into the container from 0.3m above the container.
-                Try your best to avoid other objects without adding too many steps to the task.
-                Immediately before descending on each object, decide between the [0, math.pi, math.pi / 2] target_orn (y direction is short) or the [0, math.pi, 0] target_orn (x direction is short).
-                The table's height is 0.626m. The opposite corners of its rectangular surface have the following (x, y) coordinates in meters: (0.43, -0.95) and (1.5, 0.55).
-                """
+# Pooled async client with deadlines and retries, used for the planner calls
+llm = AsyncLLMClient(api_key=client.api_key)
+data = DEFAULT_SCENE
+
+plan_cache = PlanCache()
+
+# "two_stage" (analysis call + list call), "structured" (one tool-use call)
+# or "ab" to split traffic between them by PLANNER_AB_STRUCTURED_FRACTION
+PLANNER_MODE = os.environ.get("PLANNER_MODE", "two_stage")
+PLANNER_AB_STRUCTURED_FRACTION = float(
+    os.environ.get("PLANNER_AB_STRUCTURED_FRACTION", "0.5"))
+STRUCTURED_MAX_TOKENS = int(os.environ.get("STRUCTURED_MAX_TOKENS", "4096"))
+# Rule-based planner for plain "put X in the container" commands
+FAST_PATH = os.environ.get("FAST_PATH", "1") == "1"
+# Overall time allowed for one sampled plan, retries and hedges included
+PLAN_DEADLINE_SECONDS = float(os.environ.get("PLAN_DEADLINE_SECONDS", "90"))
+
+# Token usage and latency per call type: analysis, plan_list, structured
+call_stats = {}
+
+planner_stats = {
+    mode: {"calls": 0, "successes": 0, "latency_total": 0.0}
+    for mode in ("two_stage", "structured")
+}
+
+PLAN_TOOL = {
+    "name": "submit_plan",
+    "description": "Submit the full sequence of robot commands that completes the task, in execution order.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "steps": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "tool": {"type": "string", "enum": ["move_arm", "open_gripper", "close_gripper"]},
+                        "target": {
+                            "type": "array", "items": {"type": "number"},
+                            "minItems": 3, "maxItems": 3,
+                            "description": "move_arm only: [x, y, z] in meters"
+                        },
+                        "target_orn": {
+                            "type": "array", "items": {"type": "number"},
+                            "minItems": 3, "maxItems": 3,
+                            "description": "move_arm only: euler orientation in radians"
+                        }
+                    },
+                    "required": ["tool"]
+                }
             }
-        ]
-    )
-    analysis = message.content
-    message = client.messages.create(
+        },
+        "required": ["steps"]
+    }
+}
+
+
+# Static instructions go in the system prompt, ahead of the per-request scene
+TASK_INSTRUCTIONS = """You are in a 3D world. You are a robot arm mounted on a table. You can control the end effector's position and gripper.
+
+Numerical scene information:
+The position is represented by a 3D vector [x, y, z]. The axes are perpendicular to each other.
+
+You can use the following functions:
+- move_arm(position)
+- open_gripper()
+- close_gripper()
+
+You must output a sequence of functions to complete the task. Go up 0.3m each time you pick up an object. Prior to routing to an object, move to a position 0.25m above it. Drop objects into the container from 0.3m above the container.
+Try your best to avoid other objects without adding too many steps to the task.
+Immediately before descending on each object, decide between the [0, math.pi, math.pi / 2] target_orn (y direction is short) or the [0, math.pi, 0] target_orn (x direction is short).
+The table's height is 0.626m. The opposite corners of its rectangular surface have the following (x, y) coordinates in meters: (0.43, -0.95) and (1.5, 0.55).
+"""
+
+STRUCTURED_INSTRUCTIONS = """
+Submit the complete sequence with the submit_plan tool.
+"""
+
+LIST_INSTRUCTIONS = f"""You are in a 3D world. You are a robot arm mounted on a table. You can control the end effector's position and gripper.
+If you move, choose coordinates of the objects we have provided.
+
+You must output a sequence of functions to complete the task. Prior to routing to an object, move to a position 0.25m above it. Go up 0.3m each time you pick up an object. Drop objects into the container from 0.3m above the container.
+Immediately before descending on each object, decide between the [0, math.pi, math.pi / 2] target_orn (y direction is short) or the [0, math.pi, 0] target_orn (x direction is short).
+
+you need to return a single list in this exact format. return nothing list just this. do not make a new list for every command.
+{["move_arm", {"target": [0.85, -0.2, 1.2], "target_orn": [0, math.pi, math.pi / 2]},
+  "close_gripper", {},
+  "move_arm", {"target": [0.85, -0.2, 1.2], "target_orn": [0, math.pi, 0]},
+  "open_gripper", {}]}
+"""
+
+
+def _fast_path(data, prompt):
+    if not FAST_PATH:
+        return None
+    plan = fast_planner.plan_locally(data, prompt)
+    if plan is not None:
+        print(
+            f"Fast-path plan ({fast_planner.hit_rate():.0%} fast-path hit rate)")
+    return plan
+
+
+def lookup_plan(data, prompt):
+    """Fast-path or cached plan, or None if the model has to be asked"""
+    local = _fast_path(data, prompt)
+    if local is not None:
+        return validate_plan(local)
+
+    cached = plan_cache.get(prompt, data)
+    if cached is not None:
+        print(f"Plan cache hit ({plan_cache.hit_rate():.0%} hit rate)")
+    return cached
+
+
+def get_response(data, prompt, mode=None):
+    """Plan a command, reusing a cached plan when the relevant scene is unchanged"""
+    with tracing.span("plan_lookup"):
+        plan = lookup_plan(data, prompt)
+    if plan is not None:
+        return plan
+
+    with tracing.span("plan_sample"):
+        result_list = sample_plan(data, prompt, mode)
+    if result_list:
+        plan_cache.put(prompt, data, result_list)
+    return result_list
+
+
+def sample_plan(data, prompt, mode=None):
+    """Ask the model for one fresh plan, returning it validated or None"""
+    mode = mode or PLANNER_MODE
+    if mode == "ab":
+        mode = "structured" if random.random() < PLANNER_AB_STRUCTURED_FRACTION else "two_stage"
+
+    start = time.monotonic()
+    deadline = start + PLAN_DEADLINE_SECONDS
+    try:
+        # A hedge is only accepted if it parses and validates, so a fast bad
+        # answer doesn't beat a slower good one
+        result_list = llm.run(llm.hedged(lambda: _sample_once(data, prompt, mode, deadline)),
+                              timeout=PLAN_DEADLINE_SECONDS)
+    except (anthropic.APIError, LLMDeadlineExceeded, TimeoutError) as e:
+        print(f"Planner {mode} failed: {e}")
+        result_list = None
+
+    stats = planner_stats[mode]
+    stats["calls"] += 1
+    stats["latency_total"] += time.monotonic() - start
+    if result_list:
+        stats["successes"] += 1
+    print(f"Planner {mode}: {time.monotonic() - start:.2f}s, success={bool(result_list)}")
+    return result_list
+
+
+async def _sample_once(data, prompt, mode, deadline):
+    repairs = []
+    try:
+        if mode == "structured":
+            result_list = await _plan_structured(data, prompt, deadline)
+        else:
+            result_list = await _plan_with_llm(data, prompt, deadline)
+        if result_list is not None:
+            result_list = validate_plan(result_list, repairs)
+    except PlanValidationError as e:
+        print(f"Rejected plan: {e}")
+        result_list = None
+    if repairs:
+        print(f"Repaired plan: {repairs}")
+    return result_list
+
+
+def encode_scene(data, prompt):
+    """Compact scene text: only the objects the command names plus the container"""
+    lines = []
+    for obj in relevant_objects(prompt, data):
+        x, y, z = obj["location"]
+        lines.append(
+            f"{obj['Object']}: [{x:.3f}, {y:.3f}, {z:.3f}] x={obj['x']} y={obj['y']}")
+    return "\n".join(lines)
+
+
+def _task_prompt(data, prompt):
+    return f"""Your goal is to complete the following task:
+{prompt}
+
+The objects in the current scene are (name: [x, y, z] and which sides are short):
+{encode_scene(data, prompt)}"""
+
+
+def _record_call(label, message, start, first_token=None):
+    """Accumulate token usage and latency per call type"""
+    usage = message.usage
+    stats = call_stats.setdefault(label, {
+        "calls": 0, "input_tokens": 0, "cache_read_input_tokens": 0,
+        "cache_creation_input_tokens": 0, "output_tokens": 0,
+        "latency_total": 0.0, "ttft_total": 0.0
+    })
+    stats["calls"] += 1
+    stats["input_tokens"] += usage.input_tokens
+    stats["cache_read_input_tokens"] += getattr(
+        usage, "cache_read_input_tokens", None) or 0
+    stats["cache_creation_input_tokens"] += getattr(
+        usage, "cache_creation_input_tokens", None) or 0
+    stats["output_tokens"] += usage.output_tokens
+    stats["latency_total"] += time.monotonic() - start
+    stats["ttft_total"] += (first_token or time.monotonic()) - start
+    print(f"LLM {label}: {time.monotonic() - start:.2f}s, {usage.input_tokens} in "
+          f"(+{getattr(usage, 'cache_read_input_tokens', None) or 0} cached), {usage.output_tokens} out")
+
+
+async def _plan_structured(data, prompt, deadline=None):
+    """Single request: the model returns the plan through the submit_plan tool"""
+    start = time.monotonic()
+    with tracing.span("llm:structured"):
+        message = await llm.create(
+            deadline=deadline,
+            model="claude-sonnet-4-20250514",
+            max_tokens=STRUCTURED_MAX_TOKENS,
+            temperature=1,
+            system=TASK_INSTRUCTIONS + STRUCTURED_INSTRUCTIONS,
+            tools=[PLAN_TOOL],
+            tool_choice={"type": "tool", "name": PLAN_TOOL["name"]},
+            messages=[
+                {
+                    "role": "user",
+                    "content": _task_prompt(data, prompt)
+                }
+            ]
+        )
+    _record_call("structured", message, start)
+
+    for block in message.content:
+        if block.type == "tool_use" and block.name == PLAN_TOOL["name"]:
+            result_list = _flatten_steps(block.input.get("steps", []))
+            print(f"Parsed list: {result_list}")
+            return result_list
+    print("No submit_plan call found in response")
+    return None
+
+
+def _flatten_steps(steps):
+    """Convert tool-use steps into the flat [name, args, name, args, ...] plan format
+
+    Raises PlanValidationError for a malformed tool input, which the model
+    can produce despite the schema.
+    """
+    if not isinstance(steps, list):
+        raise PlanValidationError(f"steps must be a list, got {steps!r}")
+    result_list = []
+    for step in steps:
+        if not isinstance(step, dict):
+            raise PlanValidationError(f"Step must be an object, got {step!r}")
+        tool = step.get("tool")
+        if not isinstance(tool, str) or tool not in TOOL_ARGS:
+            raise PlanValidationError(f"Unknown tool {tool!r}")
+        args = {}
+        if tool == "move_arm":
+            args["target"] = step.get("target")
+            if step.get("target_orn") is not None:
+                args["target_orn"] = step["target_orn"]
+        result_list += [tool, args]
+    return result_list
+
+
+async def _analyze(data, prompt, deadline=None):
+    start = time.monotonic()
+    with tracing.span("llm:analysis"):
+        message = await llm.create(
+            deadline=deadline,
+            model="claude-sonnet-4-20250514",
+            max_tokens=20000,
+            temperature=1,
+            system=TASK_INSTRUCTIONS,
+            messages=[
+                {
+                    "role": "user",
+                    "content": _task_prompt(data, prompt)
+                }
+            ]
+        )
+    _record_call("analysis", message, start)
+    return "".join(block.text for block in message.content if block.type == "text")
+
+
+def _list_request(data, prompt, analysis):
+    """Arguments for the second call, which turns the analysis into the plan list"""
+    return dict(
         model="claude-sonnet-4-20250514",
         max_tokens=20000,
         temperature=1,
+        system=LIST_INSTRUCTIONS,
         messages=[
             {
                 "role": "user",
-                "content": f"""
-                    You are in a 3D world. You are a robot arm mounted on a table. You can control the end effector's position and gripper. 
-                    If you move, choose coordinates of the objects we have provided.
-
-                    original data: {data}
-                    task: {prompt}
-                    analysis: {analysis}
-
-                    You must output a sequence of functions to complete the task. Prior to routing to an object, move to a position 0.25m above it. Go up 0.3m each time you pick up an object. Drop objects into the container from 0.3m above the container.
-                    Immediately before descending on each object, decide between the [0, math.pi, math.pi / 2] target_orn (y direction is short) or the [0, math.pi, 0] target_orn (x direction is short).
-
-                    you need to return a single list in this exact format. return nothing list just this. do not make a new list for every command.
-                    {["move_arm", {"target": [0.85, -0.2, 1.2], "target_orn": [0, math.pi, math.pi / 2]},
-                    "close_gripper", {},
-                    "move_arm", {"target": [0.85, -0.2, 1.2], "target_orn": [0, math.pi, 0]},
-                    "open_gripper", {}]}
-                """
+                "content": f"""{_task_prompt(data, prompt)}
+
+Analysis:
+{analysis}"""
             }
         ]
     )
+
+
+def stream_response(data, prompt):
+    """Yield (tool_name, args) pairs as soon as each is complete in the streamed plan
+
+    Raises PlanParseError if a later part of the stream can't be parsed, so the
+    caller can abort the steps it has not dispatched yet.
+    """
+    cached = lookup_plan(data, prompt)
+    if cached is not None:
+        for i in range(0, len(cached) - 1, 2):
+            yield cached[i], cached[i + 1]
+        return
+
+    # Both calls share one budget, as in sample_plan
+    deadline = time.monotonic() + PLAN_DEADLINE_SECONDS
+    analysis = llm.run(_analyze(data, prompt, deadline), timeout=PLAN_DEADLINE_SECONDS)
+    parser = IncrementalPlanParser()
+    result_list = []
+    start = time.monotonic()
+    first_token = None
+    with tracing.span("llm:plan_list_stream"), \
+            llm.stream(deadline=deadline, **_list_request(data, prompt, analysis)) as stream:
+        for text in stream.text_stream:
+            first_token = first_token or time.monotonic()
+            for tool_name, tool_args in parser.feed(text):
+                tool_args = validate_step(tool_name, tool_args)
+                print(f"Streamed step: {tool_name} {tool_args}")
+                result_list += [tool_name, tool_args]
+                yield tool_name, tool_args
+        _record_call("plan_list", stream.get_final_message(), start, first_token)
+    parser.finish()
+    plan_cache.put(prompt, data, result_list)
+
+
+async def _plan_with_llm(data, prompt, deadline=None):
+    analysis = await _analyze(data, prompt, deadline)
+    start = time.monotonic()
+    with tracing.span("llm:plan_list"):
+        message = await llm.create(deadline=deadline, **_list_request(data, prompt, analysis))
+    _record_call("plan_list", message, start)
     print(message.content)
 
     # Extract text from TextBlock if it's a list
@@ -111,13 +366,13 @@ def get_response(data, prompt):
         response_text = message.content[0].text
         print(f"Extracted text: {response_text}")
 
-        # Convert the string representation to a Python list
-        import ast
+        # Find the list even if the model wrapped it in prose
         try:
-            result_list = ast.literal_eval(response_text)
+            with tracing.span("parse"):
+                result_list = extract_plan(response_text)
             print(f"Parsed list: {result_list}")
             return result_list
-        except Exception as e:
+        except PlanValidationError as e:
             print(f"Error parsing list: {e}")
             return None
     else:
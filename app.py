@@ -1,120 +1,133 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify
 from flask_cors import CORS
+from werkzeug.serving import is_running_from_reloader
 import os
-import tempfile
-import sounddevice as sd
-import numpy as np
-import scipy.io.wavfile
 import io
+import json
 import warnings
 import threading
-import time
-import asyncio
-from datetime import datetime
-from LLMPipeline import get_response
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-
-data = [{
-    "Object": "apple",
-    "x": "short",
-    "y": "short",
-    "location": [0.82, -0.3, 0.6849899910813102]
-},
-    {
-    "Object": "bottle",
-    "location": [0.7, 0.1, 0.8],
-    "x": "short",
-    "y": "short"
-},
-    {
-    "Object": "box",
-    "location": [1, 0.1, 0.7],
-    "x": "long",
-    "y": "short"
-},
-    {
-    "Object": "banana",
-    "location": [0.893, 0.313, 0.660],
-    "x": "long",
-    "y": "short"
-},
-    {
-    "Object": "container",
-    "location": [0.9, -0.75, 0.73],
-    "x": "long",
-    "y": "long"
-},
-    {
-    "Object": "hammer",
-    "location": [1, -0.2, 0.7],
-    "x": "short",
-    "y": "long"
-}]
+import logging
+import random
+import tracing
+from LLMPipeline import PLANNER_MODE, call_stats, get_response, plan_cache, planner_stats, stream_response
+import fast_planner
+from whisper_registry import registry as whisper_registry
+from transcript_sessions import TranscriptAggregator
+from audio_decode import MAX_UPLOAD_BYTES, UploadTooLarge, decode_stream
+from mcp_pool import RobotSessionPool
+from jobs import JobManager, JobQueueFull
+from plan_validation import validate_plan
+from plan_optimizer import PLAN_OPTIMIZER, optimize_plan
+from collision_check import COLLISION_CHECK, CollisionChecker
+from plan_dryrun import DRYRUN_CANDIDATES, PlanDryRunner
+from scene import SceneStateCache
+from recording import RecordingLimitReached, RecordingManager, RecordingSessionError
+
 # Suppress the FP16 warning
 warnings.filterwarnings(
     "ignore", message="FP16 is not supported on CPU; using FP32 instead")
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+# Leave headroom for the multipart envelope around the audio file
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 1024 * 1024
+
+# Dispatch robot steps while the two-stage planner is still streaming its list.
+# The collision precheck needs the whole plan before the robot moves, so by
+# default (COLLISION_CHECK=1) streaming is traded away for it; set
+# COLLISION_CHECK=0 to stream
+STREAM_PLANS = os.environ.get("STREAM_PLANS", "1") == "1"
+# Run the dev server (python app.py) under the auto-reloader
+USE_RELOADER = os.environ.get("USE_RELOADER", "1") == "1"
+# Fraction of requests whose headers and body are dumped to the log
+REQUEST_DUMP_SAMPLE_RATE = float(os.environ.get("REQUEST_DUMP_SAMPLE_RATE", "0.01"))
+
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"),
+                    format="[%(asctime)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+logger = logging.getLogger("app")
+if STREAM_PLANS and COLLISION_CHECK:
+    logger.warning("Plan streaming is off while the collision precheck is on (COLLISION_CHECK=1)")
+http_requests = tracing.metrics.counter(
+    "http_requests_total", "Requests served, by endpoint and status")
 
-# Global variables for recording
-recording_thread = None
-is_recording = False
-audio_chunks = []
 fs = 16000
 
 
 def log_message(message):
     """Helper function to log messages with timestamp"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}] {message}")
-
-
-def record_audio():
-    """Record audio in a separate thread"""
-    global audio_chunks, is_recording
-    audio_chunks = []
-    log_message("🎤 Starting audio recording thread")
-
-    def callback(indata, frames, time, status):
-        if is_recording:
-            audio_chunks.append(indata.copy())
-            if len(audio_chunks) % 10 == 0:  # Log every 10 chunks
-                log_message(
-                    f"📊 Recorded {len(audio_chunks)} audio chunks so far")
-
-    with sd.InputStream(callback=callback, channels=1, samplerate=fs):
-        while is_recording:
-            time.sleep(0.1)
-
-
-def transcribe_audio(audio_data):
-    """Transcribe audio data"""
+    logger.info(message)
+
+
+def sample_request_dump():
+    """Whether to log this request's full headers and body"""
+    return random.random() < REQUEST_DUMP_SAMPLE_RATE
+
+
+# Long-lived MCP connection(s) to server.py, shared by all requests
+robot_pool = RobotSessionPool(log=log_message)
+# Bounded worker pool with per-stage (asr/llm/robot) concurrency limits
+job_manager = JobManager()
+# Live object locations from the robot server, refetched only after motion.
+# Read outside the plan queue so a running plan doesn't hold it up
+SCENE_FETCH_TIMEOUT = float(os.environ.get("SCENE_FETCH_TIMEOUT", "2"))
+scene_state = SceneStateCache(
+    lambda known_version: robot_pool.read_tool(
+        'get_scene_state', {'known_version': known_version}, timeout=SCENE_FETCH_TIMEOUT),
+    log=log_message)
+# Headless simulators that try out several sampled plans before the live arm
+plan_dry_runner = PlanDryRunner(log=log_message)
+tracing.metrics.counter_from("plan_cache_events_total", "Plan cache hits, misses and invalidations",
+                             lambda: plan_cache.stats)
+tracing.metrics.counter_from("fast_path_events_total", "Rule-based planner hits and misses",
+                             lambda: fast_planner.stats)
+tracing.metrics.counter_from("llm_input_tokens_total", "Uncached input tokens sent, by call type",
+                             lambda: {label: stats["input_tokens"] for label, stats in call_stats.items()})
+tracing.metrics.counter_from("llm_cached_input_tokens_total", "Input tokens read from the prompt cache, by call type",
+                             lambda: {label: stats["cache_read_input_tokens"] for label, stats in call_stats.items()})
+tracing.metrics.counter_from("llm_output_tokens_total", "Output tokens received, by call type",
+                             lambda: {label: stats["output_tokens"] for label, stats in call_stats.items()})
+tracing.metrics.counter_from("planner_calls_total", "Plans requested from the LLM, by planner mode",
+                             lambda: {mode: stats["calls"] for mode, stats in planner_stats.items()})
+tracing.metrics.counter_from("planner_successes_total", "LLM plans that parsed and validated, by planner mode",
+                             lambda: {mode: stats["successes"] for mode, stats in planner_stats.items()})
+tracing.metrics.counter_from("planner_seconds_total", "Time spent in LLM planning, by planner mode",
+                             lambda: {mode: stats["latency_total"] for mode, stats in planner_stats.items()})
+tracing.metrics.gauge("robot_sessions_connected", "Live MCP connections to server.py",
+                      lambda: sum(robot_pool.connected))
+tracing.metrics.gauge("robot_plans_pending", "Plans waiting for a robot session",
+                      lambda: robot_pool.pending())
+# Microphone sessions on this machine, one per operator station
+recordings = RecordingManager(fs, log=log_message)
+# Headless copy of the scene that sweeps each move before the live arm runs it
+_collision_checker = None
+_collision_checker_lock = threading.Lock()
+
+
+def collision_checker():
+    global _collision_checker
+    with _collision_checker_lock:
+        if _collision_checker is None:
+            _collision_checker = CollisionChecker()
+        return _collision_checker
+
+
+def transcribe_audio(audio):
+    """Transcribe a float32 array of recorded samples"""
     try:
         log_message("🔍 Starting audio transcription")
-        # Import whisper here to avoid circular import
-        import whisper
-        model = whisper.load_model("base")
-
-        # Combine all audio chunks
-        if audio_chunks:
-            log_message(f"🎵 Processing {len(audio_chunks)} audio chunks")
-            audio = np.concatenate(audio_chunks, axis=0).flatten()
+
+        if len(audio):
             log_message(
                 f"📏 Audio length: {len(audio)} samples ({len(audio)/fs:.2f} seconds)")
 
-            # Save temp WAV and transcribe
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
-                scipy.io.wavfile.write(f.name, fs, audio.astype(np.float32))
-                log_message("🎯 Running Whisper transcription...")
-                result = model.transcribe(f.name)
-                os.unlink(f.name)  # Clean up temp file
+            log_message("🎯 Running Whisper transcription...")
+            with tracing.span("asr"):
+                result = whisper_registry.transcribe(audio)
 
             log_message(f"✅ Transcription completed: '{result['text']}'")
             return result["text"]
         else:
-            log_message("⚠️ No audio chunks to transcribe")
+            log_message("⚠️ No audio to transcribe")
             return ""
 
     except Exception as e:
@@ -122,76 +135,155 @@ def transcribe_audio(audio_data):
         return ""
 
 
+def decode_and_transcribe(stream):
+    """Decode an encoded audio stream in memory and run Whisper on it"""
+    # Decode straight from the upload stream; only MP4 containers are spooled to disk
+    with tracing.span("decode"):
+        audio = decode_stream(stream)
+    log_message(
+        f"📏 Decoded {len(audio)} samples ({len(audio)/fs:.2f} seconds)")
+
+    log_message("🎯 Running Whisper transcription on uploaded file...")
+    with tracing.span("asr"):
+        result = whisper_registry.transcribe(audio)
+    log_message(f"✅ Upload transcription completed: '{result['text']}'")
+    return result["text"]
+
+
 def transcribe_uploaded_file(audio_file):
     """Transcribe uploaded audio file"""
     try:
         log_message(f"📁 Processing uploaded file: {audio_file.filename}")
         log_message(f"📋 File content type: {audio_file.content_type}")
-        log_message(f"📋 File size: {len(audio_file.read())} bytes")
-        audio_file.seek(0)  # Reset file pointer after reading
-
-        # Import whisper here to avoid circular import
-        import whisper
-        model = whisper.load_model("base")
-
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(suffix=".m4a", delete=False) as f:
-            audio_file.save(f.name)
-            log_message(f"💾 Saved temporary file: {f.name}")
-
-            try:
-                log_message(
-                    "🎯 Running Whisper transcription on uploaded file...")
-                result = model.transcribe(f.name)
-                log_message(
-                    f"✅ Upload transcription completed: '{result['text']}'")
-                return result["text"]
-            except Exception as transcribe_error:
-                log_message(
-                    f"❌ Whisper transcription failed: {transcribe_error}")
-                # Try with different file extension if m4a fails
-                import shutil
-                wav_file = f.name.replace('.m4a', '.wav')
-                shutil.copy2(f.name, wav_file)
-                log_message(f"🔄 Trying with WAV format: {wav_file}")
-                try:
-                    result = model.transcribe(wav_file)
-                    log_message(
-                        f"✅ WAV transcription completed: '{result['text']}'")
-                    os.unlink(wav_file)  # Clean up WAV file
-                    return result["text"]
-                except Exception as wav_error:
-                    log_message(
-                        f"❌ WAV transcription also failed: {wav_error}")
-                    os.unlink(wav_file)  # Clean up WAV file
-                    raise transcribe_error
-            finally:
-                os.unlink(f.name)  # Clean up temp file
 
+        return decode_and_transcribe(audio_file.stream)
+
+    except UploadTooLarge:
+        raise
     except Exception as e:
         log_message(f"❌ Error in transcribe_uploaded_file: {e}")
         return f"Transcription failed: {str(e)}"
 
 
+def request_route():
+    # No endpoint for 404s and other requests that matched no route
+    return request.endpoint or "unmatched"
+
+
+_services_started = False
+_services_lock = threading.Lock()
+
+
+def start_background_services():
+    """Warm up Whisper and connect to the robot, once per serving process
+
+    Called from the first request as well as at startup, so processes that
+    never run app.py as __main__ (gunicorn, flask run, tests) warm up too.
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
+    log_message(
+        f"🧠 Loading Whisper '{whisper_registry.default_size}' model in the background")
+    whisper_registry.warm_up_async()
+    log_message("🦾 Connecting to the robot MCP server")
+    robot_pool.start()
+    if DRYRUN_CANDIDATES > 1:
+        log_message(
+            f"🧪 Warming up {plan_dry_runner.workers} dry-run simulators")
+        threading.Thread(target=plan_dry_runner.start, daemon=True).start()
+
+
+@app.before_request
+def start_services():
+    start_background_services()
+
+
+@app.before_request
+def start_request_span():
+    # One trace per request; spans opened while handling it nest under this one
+    g.request_span = tracing.span(f"http:{request_route()}")
+    g.request_span_record = g.request_span.__enter__()
+
+
+@app.after_request
+def count_request(response):
+    http_requests.inc(endpoint=request_route(), status=response.status_code)
+    record = g.get("request_span_record")
+    if record is not None:
+        record.attrs["status"] = response.status_code
+        # Handled failures return a response rather than raising
+        if response.status_code >= 500:
+            record.error = f"HTTP {response.status_code}"
+    return response
+
+
+@app.teardown_request
+def end_request_span(error):
+    request_span = g.pop("request_span", None)
+    g.pop("request_span_record", None)
+    if request_span is not None:
+        # An unhandled exception is recorded on the span and counted as a stage error
+        if error is not None:
+            request_span.__exit__(type(error), error, error.__traceback__)
+        else:
+            request_span.__exit__(None, None, None)
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(tracing.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/')
 def index():
     log_message("🌐 Homepage requested")
     return app.send_static_file('index.html')
 
 
+@app.route('/ready')
+def ready():
+    """Readiness check: 200 once the default Whisper model is resident"""
+    status = {
+        'ready': whisper_registry.is_ready(),
+        'whisper_models': whisper_registry.loaded_sizes(),
+        'robot_connected': robot_pool.is_healthy(),
+        'robot_queue': robot_pool.pending()
+    }
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+def recording_session_id():
+    """Session id from the JSON body, query string or X-Session-Id header, if any"""
+    body = request.get_json(silent=True) or {}
+    return (body.get('session_id') or request.args.get('session_id')
+            or request.headers.get('X-Session-Id'))
+
+
+def recording_device():
+    """Input device for a new session from the JSON body or query string, if any"""
+    body = request.get_json(silent=True) or {}
+    return body.get('device') or request.args.get('device')
+
+
 @app.route('/start_recording', methods=['POST'])
 def start_recording():
-    global recording_thread, is_recording
-
     try:
         log_message("▶️ Start recording request received")
-        is_recording = True
-        recording_thread = threading.Thread(target=record_audio)
-        recording_thread.start()
+        session = recordings.start(recording_session_id(), recording_device())
         log_message("✅ Recording started successfully")
 
-        return jsonify({'status': 'Recording started'})
+        return jsonify({'status': 'Recording started', 'session_id': session.session_id})
 
+    except RecordingLimitReached as e:
+        log_message(f"❌ {e}")
+        return jsonify({'error': str(e)}), 429
+    except RecordingSessionError as e:
+        log_message(f"❌ {e}")
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         log_message(f"❌ Error starting recording: {e}")
         return jsonify({'error': 'Failed to start recording'}), 500
@@ -199,36 +291,42 @@ def start_recording():
 
 @app.route('/stop_recording', methods=['POST'])
 def stop_recording():
-    global recording_thread, is_recording
-
     try:
         log_message("⏹️ Stop recording request received")
-        is_recording = False
+        try:
+            session = recordings.stop(recording_session_id())
+        except RecordingSessionError as e:
+            log_message(f"❌ {e}")
+            return jsonify({'error': str(e)}), 404
 
-        if recording_thread:
-            recording_thread.join(timeout=2)
+        log_message(f"📊 Recorded {session.seconds:.2f}s of audio")
 
-        log_message(f"📊 Total audio chunks recorded: {len(audio_chunks)}")
-
-        # Transcribe the recorded audio
-        transcription = transcribe_audio(audio_chunks)
+        # Transcribe the recorded audio on one of the shared ASR slots
+        with job_manager.stage_slot('asr'):
+            transcription = transcribe_audio(session.buffer.to_array())
 
         log_message(f"📝 Final transcription: '{transcription}'")
-        return jsonify({'transcription': transcription})
+        return jsonify({'transcription': transcription, 'session_id': session.session_id})
 
     except Exception as e:
         log_message(f"❌ Error stopping recording: {e}")
         return jsonify({'error': 'Failed to stop recording'}), 500
 
 
+@app.route('/recordings', methods=['GET'])
+def list_recordings():
+    return jsonify({'sessions': recordings.active(), 'max_sessions': recordings.max_sessions})
+
+
 @app.route('/transcribe', methods=['POST'])
 def transcribe_upload():
     """Handle file upload from React Native app"""
     try:
         log_message("📤 Transcribe upload request received")
-        log_message(f"📋 Request headers: {dict(request.headers)}")
-        log_message(f"📋 Request form data: {dict(request.form)}")
-        log_message(f"📋 Request files: {list(request.files.keys())}")
+        if sample_request_dump():
+            log_message(f"📋 Request headers: {dict(request.headers)}")
+            log_message(f"📋 Request form data: {dict(request.form)}")
+            log_message(f"📋 Request files: {list(request.files.keys())}")
 
         if 'audio' not in request.files:
             log_message("❌ No audio file in request.files")
@@ -242,15 +340,27 @@ def transcribe_upload():
             return jsonify({'error': 'No file selected'}), 400
 
         # Transcribe the uploaded file
-        transcription = transcribe_uploaded_file(audio_file)
+        try:
+            with job_manager.stage_slot('asr'):
+                transcription = transcribe_uploaded_file(audio_file)
+        except UploadTooLarge as e:
+            log_message(f"❌ {e}")
+            return jsonify({'error': str(e)}), 413
 
         log_message(f"📤 Sending transcription response: '{transcription}'")
-        plan = get_response(data, transcription)
+        if streaming_plans():
+            with job_manager.stage_slot('llm'), job_manager.stage_slot('robot'):
+                stream_and_execute(transcription)
+            return jsonify({'transcription': transcription})
+
+        with job_manager.stage_slot('llm'):
+            plan = plan_command(transcription)
 
         if plan:
             log_message(f"🤖 Executing robot plan: {plan}")
             # Execute the MCP plan
-            asyncio.run(execute_mcp_plan(plan))
+            with job_manager.stage_slot('robot'):
+                execute_mcp_plan(plan)
         else:
             log_message("⚠️ No plan generated from transcription")
 
@@ -260,6 +370,87 @@ def transcribe_upload():
         log_message(f"❌ Error in transcribe_upload: {e}")
         return jsonify({'error': 'Failed to transcribe audio'}), 500
 
+
+def run_voice_job(job, audio_bytes):
+    """Job pipeline: transcribe, plan, then drive the robot"""
+    with job_manager.stage(job, 'asr'):
+        transcription = decode_and_transcribe(io.BytesIO(audio_bytes))
+    job.update(message=f"Transcription: {transcription}")
+
+    if streaming_plans():
+        with job_manager.stage(job, 'llm'), job_manager.stage_slot('robot'):
+            job.update(stage='llm+robot')
+            results = stream_and_execute(transcription)
+        return {'transcription': transcription, 'results': results}
+
+    with job_manager.stage(job, 'llm'):
+        plan = plan_command(transcription)
+    if not plan:
+        job.update(message="No plan generated from transcription")
+        return {'transcription': transcription, 'plan': None}
+    job.update(message=f"Plan with {len(plan) // 2} steps")
+
+    with job_manager.stage(job, 'robot'):
+        results = execute_mcp_plan(plan)
+    return {'transcription': transcription, 'plan': plan, 'results': results}
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Accept an audio upload and process it in the background"""
+    try:
+        log_message("📤 Job submission received")
+        if 'audio' not in request.files:
+            log_message("❌ No audio file in request.files")
+            return jsonify({'error': 'No audio file provided'}), 400
+
+        # The upload stream is closed once the request ends, so keep the bytes
+        audio_bytes = request.files['audio'].read()
+        job = job_manager.submit('voice', run_voice_job, audio_bytes)
+        log_message(f"🗂️ Queued job {job.id}")
+
+        return jsonify({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f"/jobs/{job.id}",
+            'events_url': f"/jobs/{job.id}/events"
+        }), 202
+
+    except JobQueueFull as e:
+        log_message(f"❌ Job queue full: {e}")
+        return jsonify({'error': 'Too many pending jobs'}), 503
+    except Exception as e:
+        log_message(f"❌ Error submitting job: {e}")
+        return jsonify({'error': 'Failed to submit job'}), 500
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream job progress as server-sent events"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+
+    def generate():
+        for event in job_manager.follow(job):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+        yield f"event: done\ndata: {json.dumps(job.to_dict())}\n\n"
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
 # Add a new endpoint to receive transcript chunks
 
 
@@ -268,30 +459,41 @@ def receive_transcript():
     """Receive transcript chunks from the React Native app"""
     try:
         log_message("📨 Transcript chunk received")
-        log_message(f"📋 Request headers: {dict(request.headers)}")
-        log_message(f"📋 Request JSON: {request.get_json()}")
+        if sample_request_dump():
+            log_message(f"📋 Request headers: {dict(request.headers)}")
+            log_message(f"📋 Request JSON: {request.get_json()}")
 
-        data = request.get_json()
-        if not data:
+        chunk = request.get_json()
+        if not chunk:
             log_message("❌ No JSON data in request")
             return jsonify({'error': 'No data provided'}), 400
 
-        transcript_chunk = data.get('transcript', '')
-        chunk_id = data.get('id', 'unknown')
-        is_final = data.get('isFinal', False)
+        transcript_chunk = chunk.get('transcript', '')
+        chunk_id = chunk.get('id', 'unknown')
+        is_final = chunk.get('isFinal', False)
+        session_id = chunk.get('sessionId') or request.headers.get(
+            'X-Session-Id') or request.remote_addr
 
         log_message(
             f"📝 Transcript chunk {chunk_id}: '{transcript_chunk}' (final: {is_final})")
 
-        # Here you can process the transcript chunk as needed
-        # For now, just acknowledge receipt
+        aggregate = transcript_aggregator.receive(
+            session_id, chunk_id, transcript_chunk, is_final)
 
         response = {
             'status': 'received',
             'chunk_id': chunk_id,
             'transcript': transcript_chunk,
-            'is_final': is_final
+            'is_final': is_final,
+            'session_id': session_id,
+            'aggregate': aggregate['text']
         }
+        if is_final:
+            log_message(
+                f"🤖 Final transcript '{aggregate['text']}', plan {aggregate['plan']}")
+            response['plan'] = aggregate['plan']
+        else:
+            response['speculating'] = aggregate['speculating']
         log_message(f"✅ Sending acknowledgment for chunk {chunk_id}")
         return jsonify(response)
 
@@ -300,33 +502,104 @@ def receive_transcript():
         return jsonify({'error': 'Failed to process transcript chunk'}), 500
 
 
-async def execute_mcp_plan(tool_plan: list):
-    """Execute a list of MCP tool calls"""
-    server_params = StdioServerParameters(command="python", args=["server.py"])
-
+def execute_mcp_plan(tool_plan: list):
+    """Execute a list of MCP tool calls on the shared robot session"""
     try:
-        async with stdio_client(server_params) as (read, write):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                log_message("✅ Connected to MCP server")
+        # Reject bad plans before spending any simulation time on them
+        repairs = []
+        tool_plan = validate_plan(tool_plan, repairs)
+        if repairs:
+            log_message(f"🩹 Repaired plan: {repairs}")
+        if PLAN_OPTIMIZER:
+            with tracing.span("optimize"):
+                tool_plan, report = optimize_plan(tool_plan)
+            log_message(f"✂️ Optimized plan: {report}")
+        if COLLISION_CHECK:
+            scene = scene_state.get()
+            with tracing.span("collision_check"):
+                tool_plan, report = collision_checker().fix_plan(
+                    tool_plan, scene, scene_state.arm_joints())
+            if report["colliding"]:
+                log_message(f"🚧 Collision precheck: {report}")
+            if report["unresolved"]:
+                log_message(f"⚠️ Moves still colliding after lifting: {report['unresolved']}")
+        try:
+            with tracing.span("robot", steps=len(tool_plan) // 2):
+                results = robot_pool.run_plan(tool_plan)
+        finally:
+            scene_state.invalidate()
+        log_message("🎉 All MCP tool calls completed successfully")
+        return results
+
+    except Exception as e:
+        log_message(f"❌ Error executing MCP plan: {e}")
+        raise e
+
+
+def streaming_plans():
+    # Streamed steps go to the robot one by one, so whole-plan optimization
+    # (plan_optimizer) only applies to the other modes; see STREAM_PLANS
+    return (STREAM_PLANS and not COLLISION_CHECK and PLANNER_MODE == "two_stage"
+            and DRYRUN_CANDIDATES < 2)
 
-                # Execute each tool call in the plan
-                for i in range(0, len(tool_plan), 2):
-                    if i + 1 < len(tool_plan):
-                        tool_name = tool_plan[i]
-                        tool_args = tool_plan[i + 1]
 
-                        log_message(
-                            f"🔧 Executing {tool_name} with args: {tool_args}")
-                        result = await session.call_tool(tool_name, tool_args)
-                        log_message(
-                            f"✅ {tool_name} completed: {result.content[0].text if result.content else 'No output'}")
+def plan_command(transcription):
+    """Plan a transcription, dry-running several candidates when enabled"""
+    scene = scene_state.get()
+    with tracing.span("plan"):
+        if DRYRUN_CANDIDATES < 2:
+            return get_response(scene, transcription)
+        plan, report = plan_dry_runner.select(
+            scene, transcription, arm_joints=scene_state.arm_joints())
+    log_message(f"🧪 Dry-run selection: {report}")
+    return plan
 
-                log_message("🎉 All MCP tool calls completed successfully")
 
+def stream_and_execute(transcription):
+    """Send each planned step to the robot as soon as the LLM has produced it"""
+    # Fetch the scene first: the stream holds the robot connection until it closes
+    scene = scene_state.get()
+    stream = robot_pool.open_stream()
+    try:
+        try:
+            with tracing.span("plan_streamed"):
+                for tool_name, tool_args in stream_response(scene, transcription):
+                    stream.send(tool_name, tool_args)
+        except Exception as e:
+            log_message(f"❌ Plan stream failed, aborting remaining steps: {e}")
+            stream.abort()
+            raise
+        stream.close()
+        results = stream.result()
+    finally:
+        # Steps sent before an abort may already have moved the arm
+        scene_state.invalidate()
+    log_message("🎉 All MCP tool calls completed successfully")
+    return results
+
+
+def plan_transcript(transcript):
+    """Plan a streamed transcript against the current scene"""
+    try:
+        log_message(f"🧭 Planning for transcript: '{transcript}'")
+        with job_manager.stage_slot('llm'):
+            return plan_command(transcript)
     except Exception as e:
-        log_message(f"❌ Error executing MCP plan: {e}")
-        raise e
+        log_message(f"❌ Error planning streamed transcript: {e}")
+        return None
+
+
+def execute_streamed_plan(plan):
+    try:
+        log_message(f"🤖 Executing robot plan: {plan}")
+        with job_manager.stage_slot('robot'):
+            execute_mcp_plan(plan)
+    except Exception as e:
+        log_message(f"❌ Error executing streamed plan: {e}")
+
+
+transcript_aggregator = TranscriptAggregator(
+    plan_transcript, execute_streamed_plan)
 
 if __name__ == '__main__':
     # Create static folder if it doesn't exist
@@ -338,11 +611,17 @@ if __name__ == '__main__':
         shutil.move('index.html', 'static/index.html')
 
     log_message("🎤 Voice Transcription Server Starting...")
+    # With the reloader, this block also runs in a watcher process that never
+    # serves requests; only warm up in the process that does
+    if not USE_RELOADER or is_running_from_reloader():
+        start_background_services()
     log_message("📱 Open your browser and go to: http://localhost:5001")
     log_message("📱 For React Native app, use your computer's IP address")
     log_message(
         "🎙️ Click 'Start Recording' to begin, then 'Stop Recording' when done!")
     log_message(
         "📨 New endpoint /receive_transcript available for transcript chunks")
+    log_message(
+        "🗂️ POST /jobs to process audio in the background, poll /jobs/<id> or stream /jobs/<id>/events")
 
-    app.run(debug=True, host='0.0.0.0', port=5001)
+    app.run(debug=True, use_reloader=USE_RELOADER, host='0.0.0.0', port=5001)
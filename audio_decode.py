@@ -0,0 +1,132 @@
+import os
+import subprocess
+import tempfile
+import threading
+import numpy as np
+
+SAMPLE_RATE = 16000
+MAX_UPLOAD_BYTES = int(os.environ.get(
+    "MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+READ_CHUNK_BYTES = 64 * 1024
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+class UploadTooLarge(AudioDecodeError):
+    pass
+
+
+def _ffmpeg_cmd(source, sr):
+    return [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0",
+        "-i", source,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sr),
+        "pipe:1",
+    ]
+
+
+def _to_array(returncode, pcm, stderr):
+    if returncode != 0:
+        raise AudioDecodeError(
+            f"ffmpeg failed: {stderr.decode(errors='replace').strip()}")
+    if not pcm:
+        raise AudioDecodeError("No audio decoded from upload")
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+
+def _is_mp4(head):
+    """MP4/M4A/MOV start with an ftyp box; their moov index is often at the end"""
+    return head[4:8] == b"ftyp"
+
+
+def _decode_pipe(head, stream, max_bytes, sr):
+    try:
+        proc = subprocess.Popen(_ffmpeg_cmd("pipe:0", sr), stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError as e:
+        raise AudioDecodeError("ffmpeg is not installed") from e
+
+    written = [0]
+    too_large = threading.Event()
+
+    def feed():
+        # Write from a separate thread so ffmpeg's stdout never fills up and blocks us
+        try:
+            chunk = head
+            while chunk:
+                written[0] += len(chunk)
+                if written[0] > max_bytes:
+                    too_large.set()
+                    break
+                proc.stdin.write(chunk)
+                chunk = stream.read(READ_CHUNK_BYTES)
+        except (BrokenPipeError, ValueError):
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    pcm = proc.stdout.read()
+    stderr = proc.stderr.read()
+    proc.wait()
+    feeder.join()
+
+    if too_large.is_set():
+        raise UploadTooLarge(
+            f"Upload exceeds the {max_bytes} byte limit")
+    return _to_array(proc.returncode, pcm, stderr)
+
+
+def _decode_spooled(head, stream, max_bytes, sr):
+    """Copy the upload to a temp file so ffmpeg can seek to an index at its end"""
+    with tempfile.NamedTemporaryFile(suffix=".m4a") as f:
+        written = 0
+        chunk = head
+        while chunk:
+            written += len(chunk)
+            if written > max_bytes:
+                raise UploadTooLarge(
+                    f"Upload exceeds the {max_bytes} byte limit")
+            f.write(chunk)
+            chunk = stream.read(READ_CHUNK_BYTES)
+        f.flush()
+        try:
+            proc = subprocess.run(_ffmpeg_cmd(f.name, sr), stdin=subprocess.DEVNULL,
+                                  capture_output=True)
+        except FileNotFoundError as e:
+            raise AudioDecodeError("ffmpeg is not installed") from e
+    return _to_array(proc.returncode, proc.stdout, proc.stderr)
+
+
+def _rewind(stream):
+    try:
+        stream.seek(0)
+        return True
+    except (AttributeError, OSError, ValueError):
+        return False
+
+
+def decode_stream(stream, max_bytes=MAX_UPLOAD_BYTES, sr=SAMPLE_RATE):
+    """Decode an encoded audio stream into a float32 mono array
+
+    Most formats are piped straight through ffmpeg. MP4 containers (the
+    .m4a the mobile app records) go through a temp file instead, and a
+    piped decode that fails is retried that way if the stream can rewind.
+    """
+    head = stream.read(READ_CHUNK_BYTES)
+    if _is_mp4(head):
+        return _decode_spooled(head, stream, max_bytes, sr)
+    try:
+        return _decode_pipe(head, stream, max_bytes, sr)
+    except UploadTooLarge:
+        raise
+    except AudioDecodeError:
+        if not _rewind(stream):
+            raise
+    return _decode_spooled(b"", stream, max_bytes, sr)
@@ -0,0 +1,298 @@
+"""End-to-end latency benchmark for the voice-to-robot pipeline
+
+Serves the real Flask app on a local port and posts recorded audio to
+/transcribe, with the Anthropic API replaced by stub_anthropic and the robot
+server running headless. Reports p50/p95/p99 per stage and in total for each
+concurrency level, and writes them as JSON.
+
+    python benchmarks/run_benchmark.py --concurrency 1,2,4
+    python benchmarks/run_benchmark.py --audio banana.m4a --concurrency 1,2,4
+
+Without --audio it uploads a generated WAV of --audio-seconds. The stub
+replies with the canned plan whatever Whisper hears, so every stage runs,
+but pass a real recording for representative decode and ASR times.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import platform
+import math
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import wave
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib import error, request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from stub_anthropic import StubAnthropicServer, canned_responses  # noqa: E402
+
+PERCENTILES = (50, 95, 99)
+FIXTURE_SAMPLE_RATE = 16000
+
+
+class StageRecorder:
+    """Wall-clock samples per stage, collected from every thread"""
+
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def wrap(self, owner, name, stage):
+        """Time every call to owner.name under stage; stage may be a function of the call's arguments"""
+        original = getattr(owner, name)
+        label = stage if callable(stage) else (lambda *args, **kwargs: stage)
+
+        if asyncio.iscoroutinefunction(original):
+            @functools.wraps(original)
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    self.add(label(*args, **kwargs), time.perf_counter() - start)
+        else:
+            @functools.wraps(original)
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self.add(label(*args, **kwargs), time.perf_counter() - start)
+        setattr(owner, name, timed)
+
+    def wrap_context(self, owner, name, stage):
+        """Like wrap, for a call that returns a context manager: timed until its block exits"""
+        original = getattr(owner, name)
+
+        @functools.wraps(original)
+        @contextmanager
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                with original(*args, **kwargs) as value:
+                    yield value
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        setattr(owner, name, timed)
+
+    def summary(self):
+        with self._lock:
+            return {stage: summarize(samples) for stage, samples in sorted(self._samples.items())}
+
+
+def percentile(sorted_samples, q):
+    """Nearest-rank percentile"""
+    rank = max(1, -(-q * len(sorted_samples) // 100))
+    return sorted_samples[int(rank) - 1]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    summary = {"count": len(samples), "mean": sum(samples) / len(samples)}
+    for q in PERCENTILES:
+        summary[f"p{q}"] = percentile(samples, q)
+    return {key: round(value, 4) if isinstance(value, float) else value
+            for key, value in summary.items()}
+
+
+def configure_environment(args, stub):
+    """Must run before the app (and so LLMPipeline) is imported"""
+    os.environ["ANTHROPIC_BASE_URL"] = stub.base_url
+    os.environ["ROBOT_SIM_MODE"] = "direct"
+    os.environ["MCP_POOL_SIZE"] = str(args.robot_sessions)
+    os.environ["STREAM_PLANS"] = "1" if args.stream else "0"
+    if args.stream:
+        # The app only streams plans with the collision precheck off
+        os.environ["COLLISION_CHECK"] = "0"
+    os.environ["PLANNER_MODE"] = args.planner_mode
+    os.environ["DRYRUN_CANDIDATES"] = "0"
+    # Every request should reach the (stub) model
+    os.environ["FAST_PATH"] = "0"
+    os.environ["PLAN_CACHE_SIZE"] = "0"
+    os.environ.pop("PLAN_CACHE_PATH", None)
+
+
+def instrument(recorder):
+    """Wrap each pipeline stage of the imported app with a timer"""
+    import app
+    import LLMPipeline
+    from collision_check import CollisionChecker
+    from mcp import ClientSession
+
+    def llm_call(*args, **kwargs):
+        system = json.dumps(kwargs.get("system", ""))
+        if kwargs.get("tools"):
+            return "llm_structured"
+        return "llm_call_2" if "single list" in system else "llm_call_1"
+
+    recorder.wrap(app, "decode_stream", "decode")
+    recorder.wrap(app.whisper_registry, "transcribe", "asr")
+    recorder.wrap(LLMPipeline.llm, "create", llm_call)
+    # The streamed list call lasts as long as its stream, not just the call that opens it
+    recorder.wrap_context(LLMPipeline.llm, "stream", "llm_call_2_stream")
+    recorder.wrap(LLMPipeline, "extract_plan", "parse")
+    recorder.wrap(app, "plan_command", "plan_total")
+    recorder.wrap(app, "optimize_plan", "optimize")
+    recorder.wrap(CollisionChecker, "fix_plan", "collision_check")
+    recorder.wrap(app, "stream_and_execute", "plan_and_robot_streamed")
+    recorder.wrap(ClientSession, "call_tool",
+                  lambda session, tool_name, *args, **kwargs: f"tool:{tool_name}")
+    return app
+
+
+def synthetic_fixture(seconds, directory):
+    """A 16 kHz mono WAV with a wavering tone, standing in for a recorded command"""
+    path = os.path.join(directory, f"synthetic_{seconds:g}s.wav")
+    frames = bytearray()
+    for i in range(int(seconds * FIXTURE_SAMPLE_RATE)):
+        t = i / FIXTURE_SAMPLE_RATE
+        pitch = 180 + 60 * math.sin(2 * math.pi * 3 * t)
+        frames += struct.pack("<h", int(8000 * math.sin(2 * math.pi * pitch * t)))
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(FIXTURE_SAMPLE_RATE)
+        f.writeframes(bytes(frames))
+    return path
+
+
+def multipart(path):
+    boundary = uuid.uuid4().hex
+    with open(path, "rb") as f:
+        data = f.read()
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"audio\"; "
+            f"filename=\"{os.path.basename(path)}\"\r\nContent-Type: application/octet-stream\r\n\r\n"
+            ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def post_audio(url, path):
+    body, content_type = multipart(path)
+    req = request.Request(url, data=body, headers={"Content-Type": content_type})
+    start = time.perf_counter()
+    try:
+        with request.urlopen(req) as response:
+            response.read()
+            ok = response.status == 200
+    except error.HTTPError:
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+def run_level(url, fixtures, concurrency, count, recorder, app):
+    recorder.reset()
+    app.robot_pool.call_tool("reset_scene", {})
+    app.scene_state.invalidate()
+    jobs = [fixtures[i % len(fixtures)] for i in range(count)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(lambda path: post_audio(url, path), jobs))
+    elapsed = time.perf_counter() - start
+    for ok, seconds in outcomes:
+        recorder.add("total", seconds)
+    return {
+        "concurrency": concurrency,
+        "requests": count,
+        "errors": sum(not ok for ok, _ in outcomes),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(count / elapsed, 3),
+        "stages": recorder.summary(),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--audio", nargs="+", help="recorded audio fixtures to upload (default: generated)")
+    parser.add_argument("--audio-seconds", type=float, default=3.0, help="length of the generated fixture")
+    parser.add_argument("--concurrency", default="1,2,4", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="requests per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="stub seconds per response")
+    parser.add_argument("--llm-ttft", type=float, default=0.3, help="stub seconds to first streamed text")
+    parser.add_argument("--command", default="put the banana in the container",
+                        help="command the stub's canned plan carries out")
+    parser.add_argument("--planner-mode", default="two_stage", choices=["two_stage", "structured"])
+    parser.add_argument("--stream", action="store_true", help="stream plan steps to the robot")
+    parser.add_argument("--robot-sessions", type=int, default=1, help="MCP_POOL_SIZE")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results.json"))
+    args = parser.parse_args()
+    fixture_dir = tempfile.TemporaryDirectory()
+    fixtures = args.audio or [synthetic_fixture(args.audio_seconds, fixture_dir.name)]
+
+    stub = StubAnthropicServer(args.llm_latency, args.llm_ttft, canned_responses(args.command)).start()
+    configure_environment(args, stub)
+    recorder = StageRecorder()
+    app = instrument(recorder)
+
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-flask", daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/transcribe"
+
+    start = time.perf_counter()
+    app.whisper_registry.warm_up()
+    warm_up = time.perf_counter() - start
+    start = time.perf_counter()
+    app.robot_pool.start()
+    while not app.robot_pool.is_healthy():
+        time.sleep(0.05)
+    mcp_connect = time.perf_counter() - start
+    print(f"Whisper warm-up {warm_up:.2f}s, MCP connect {mcp_connect:.2f}s")
+
+    levels = []
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        result = run_level(url, fixtures, concurrency, args.requests, recorder, app)
+        total = result["stages"].get("total", {})
+        print(f"concurrency {concurrency}: p50 {total.get('p50')}s p95 {total.get('p95')}s "
+              f"p99 {total.get('p99')}s, {result['errors']} errors")
+        levels.append(result)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "startup": {"whisper_warm_up": round(warm_up, 4), "mcp_connect": round(mcp_connect, 4)},
+        "llm_calls": stub.requests,
+        "levels": levels,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    server.shutdown()
+    app.robot_pool.close()
+    stub.close()
+    fixture_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
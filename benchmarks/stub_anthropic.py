@@ -0,0 +1,182 @@
+"""Local stand-in for the Anthropic Messages API
+
+Replays canned responses with configurable latency so the pipeline can be
+benchmarked without network calls. Point the SDK at it with
+ANTHROPIC_BASE_URL before LLMPipeline is imported.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fast_planner  # noqa: E402
+from scene import DEFAULT_SCENE  # noqa: E402
+
+DEFAULT_COMMAND = "put the banana in the container"
+# Text is streamed in pieces of about this many characters
+STREAM_CHUNK_CHARS = 40
+
+
+def canned_responses(command=DEFAULT_COMMAND):
+    """Analysis text, plan list text and tool-use steps for one command on the default scene"""
+    plan = fast_planner.plan_locally(DEFAULT_SCENE, command)
+    if plan is None:
+        raise ValueError(f"No rule-based plan for {command!r} to replay")
+    steps = []
+    for i in range(0, len(plan) - 1, 2):
+        steps.append(dict({"tool": plan[i]}, **plan[i + 1]))
+    return {
+        "analysis": f"To {command}, hover over the object, descend, grasp it, lift it "
+                    "and release it 0.3m above the container.",
+        "plan": json.dumps(plan),
+        "steps": steps,
+    }
+
+
+class StubAnthropicServer:
+    """Serves POST /v1/messages, streaming or not, from canned responses
+
+    latency is the total time per response; ttft is when the first text
+    arrives in a streamed one.
+    """
+
+    def __init__(self, latency=1.0, ttft=0.3, responses=None, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.ttft = ttft
+        self.responses = responses or canned_responses()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, name="stub-anthropic",
+                         daemon=True).start()
+        return self
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _reply(self, body):
+        """Content blocks and stop reason for a request"""
+        with self._lock:
+            self.requests += 1
+        if any(tool.get("name") == "submit_plan" for tool in body.get("tools", [])):
+            return [{"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:24]}", "name": "submit_plan",
+                     "input": {"steps": self.responses["steps"]}}], "tool_use"
+        system = json.dumps(body.get("system", ""))
+        # The list call's instructions ask for "a single list"
+        text = self.responses["plan"] if "single list" in system else self.responses["analysis"]
+        return [{"type": "text", "text": text}], "end_turn"
+
+    def _usage(self, body, content):
+        """Token counts estimated from sizes; nothing is marked for the prompt cache"""
+        prompt = [body.get("tools", []), body.get("system", ""), body.get("messages", [])]
+        return {"input_tokens": len(json.dumps(prompt)) // 4, "cache_read_input_tokens": 0,
+                "cache_creation_input_tokens": 0,
+                "output_tokens": len(json.dumps(content)) // 4}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.startswith("/v1/messages"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                content, stop_reason = stub._reply(body)
+                message = {
+                    "id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant",
+                    "model": body.get("model"), "content": content, "stop_reason": stop_reason,
+                    "stop_sequence": None, "usage": stub._usage(body, content),
+                }
+                if body.get("stream"):
+                    self._stream(message)
+                else:
+                    time.sleep(stub.latency)
+                    self._send_json(message)
+
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _event(self, name, payload):
+                chunk = f"event: {name}\ndata: {json.dumps(payload)}\n\n".encode()
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, message):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                usage = message["usage"]
+                self._event("message_start", {"type": "message_start", "message": dict(
+                    message, content=[], stop_reason=None, usage=dict(usage, output_tokens=0))})
+                time.sleep(stub.ttft)
+
+                pieces = []
+                for index, block in enumerate(message["content"]):
+                    if block["type"] == "text":
+                        text = block["text"]
+                        pieces += [(index, "text_delta", text[i:i + STREAM_CHUNK_CHARS])
+                                   for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+                    else:
+                        pieces.append((index, "input_json_delta", json.dumps(block["input"])))
+                delay = max(0.0, stub.latency - stub.ttft) / max(1, len(pieces))
+
+                for index, block in enumerate(message["content"]):
+                    start = dict(block, text="") if block["type"] == "text" else dict(block, input={})
+                    self._event("content_block_start", {"type": "content_block_start",
+                                                        "index": index, "content_block": start})
+                    for piece_index, kind, piece in pieces:
+                        if piece_index != index:
+                            continue
+                        field = "text" if kind == "text_delta" else "partial_json"
+                        self._event("content_block_delta", {"type": "content_block_delta", "index": index,
+                                                            "delta": {"type": kind, field: piece}})
+                        time.sleep(delay)
+                    self._event("content_block_stop", {"type": "content_block_stop", "index": index})
+                self._event("message_delta", {"type": "message_delta",
+                                              "delta": {"stop_reason": message["stop_reason"],
+                                                        "stop_sequence": None},
+                                              "usage": {"output_tokens": usage["output_tokens"]}})
+                self._event("message_stop", {"type": "message_stop"})
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per response")
+    parser.add_argument("--ttft", type=float, default=0.3, help="seconds to first streamed text")
+    parser.add_argument("--command", default=DEFAULT_COMMAND, help="command the canned plan carries out")
+    args = parser.parse_args()
+    server = StubAnthropicServer(args.latency, args.ttft, canned_responses(args.command), port=args.port)
+    print(f"Stub Anthropic API on {server.base_url} (ANTHROPIC_BASE_URL)")
+    server._httpd.serve_forever()
@@ -0,0 +1,248 @@
+import math
+import os
+import threading
+import numpy as np
+import pybullet as p
+from robot_controller import END_EFFECTOR_OFFSET, MAX_JOINT_STEP, RobotSim
+
+# On by default, at the cost of streamed execution (see STREAM_PLANS in app.py)
+COLLISION_CHECK = os.environ.get("COLLISION_CHECK", "1") == "1"
+# Moves passing closer than this to an object are treated as collisions
+MIN_CLEARANCE = float(os.environ.get("COLLISION_MIN_CLEARANCE", "0.02"))  # m
+# Joint-space samples per move, capped so long moves stay cheap to check
+MAX_SEGMENT_SAMPLES = 24
+# Distances beyond this aren't reported; clearance is capped to it
+CLEARANCE_QUERY_DISTANCE = 0.3  # m
+# Rays swept along the fingertips, this far either side of the gripper centre
+FINGER_SPREAD = 0.05  # m
+# The object nearest a grasp within this radius is the one being carried
+GRASP_RADIUS = 0.1  # m
+# Lift waypoints clear the tallest object in the way by this much
+LIFT_CLEARANCE = 0.1  # m
+# Gripper attachment from RobotSim: link 6 of the arm to link 0 of the gripper
+GRIPPER_CHILD_FRAME = [0, 0, 0.05]
+
+
+class CollisionChecker:
+    """Sweeps planned moves through a headless copy of the scene before the real robot runs them
+
+    For each move_arm it interpolates the joints the same way RobotSim.move_arm
+    does, poses the arm and gripper at each sample, and measures how close
+    they come to the scene objects. The object being grasped is excluded,
+    since touching it is the point of the move; once grasped it is carried
+    with the gripper and swept as part of the robot. Plans start from the
+    live arm's joints when they are passed in, otherwise from home.
+    """
+
+    def __init__(self, sim=None, min_clearance=MIN_CLEARANCE):
+        self.sim = sim or RobotSim(mode="direct")
+        self.min_clearance = min_clearance
+        self.stats = {"plans": 0, "segments": 0, "colliding": 0, "lifts_inserted": 0}
+        self._lock = threading.Lock()
+        self.sim.save_checkpoint("collision_check_home")
+        self._home_joints = self.sim._arm_state()[0]
+        # Where the gripper base sits relative to its link 0, for posing it kinematically
+        cid = self.sim.client
+        base = p.getBasePositionAndOrientation(self.sim.kuka_gripper_id, physicsClientId=cid)
+        link = p.getLinkState(self.sim.kuka_gripper_id, 0, physicsClientId=cid)[4:6]
+        self._base_in_link = p.multiplyTransforms(*p.invertTransform(*link), *base)
+
+    def check_plan(self, plan, scene=None, arm_joints=None):
+        """Clearance of every move in a flat plan, one dict per move_arm"""
+        with self._lock:
+            self._sync(scene)
+            return self._check(plan, arm_joints)
+
+    def fix_plan(self, plan, scene=None, arm_joints=None):
+        """Insert lift waypoints around colliding moves, returning (plan, report)
+
+        Moves that still collide after lifting are listed as unresolved.
+        """
+        with self._lock:
+            self._sync(scene)
+            segments = self._check(plan, arm_joints)
+            colliding = [s for s in segments if s["collides"]]
+            report = {"segments": len(segments), "colliding": len(colliding),
+                      "min_clearance": min((s["clearance"] for s in segments), default=None),
+                      "lifts_inserted": 0, "unresolved": []}
+            self.stats["plans"] += 1
+            self.stats["segments"] += len(segments)
+            self.stats["colliding"] += len(colliding)
+            if not colliding:
+                return list(plan), report
+            # Carrying objects moved them in the shadow world; put them back
+            self._sync(scene)
+
+            by_index = {s["index"]: s for s in colliding}
+            fixed = []
+            for i in range(0, len(plan) - 1, 2):
+                tool_name, tool_args = plan[i], plan[i + 1]
+                segment = by_index.get(i)
+                if segment is not None and segment["start"] is not None:
+                    for waypoint in self._lift_waypoints(segment, tool_args):
+                        fixed += ["move_arm", waypoint]
+                        report["lifts_inserted"] += 1
+                fixed += [tool_name, tool_args]
+
+            for segment in self._check(fixed, arm_joints):
+                if segment["collides"]:
+                    report["unresolved"].append(
+                        {"index": segment["index"], "target": segment["end"],
+                         "object": segment["closest"], "clearance": segment["clearance"]})
+            self.stats["lifts_inserted"] += report["lifts_inserted"]
+            return fixed, report
+
+    def _sync(self, scene):
+        self.sim.reset("collision_check_home")
+        if scene:
+            self.sim.place_objects({obj["Object"]: obj["location"] for obj in scene
+                                    if obj["Object"] in self.sim.objects})
+
+    def _check(self, plan, arm_joints=None):
+        # Start where the live arm is (the shadow world is never stepped), or home if unknown
+        joints = self._home_joints if arm_joints is None else np.asarray(arm_joints, dtype=float)
+        start, start_orn = self._tip(self._pose(joints)), None
+        held = held_offset = None
+        ignored = set()
+        segments = []
+        for i in range(0, len(plan) - 1, 2):
+            tool_name, tool_args = plan[i], plan[i + 1]
+            if tool_name == "close_gripper" and start is not None:
+                held = self._nearest_object(start, ignored)
+                if held is not None:
+                    held_offset = self._attach(held, joints)
+                continue
+            if tool_name == "open_gripper":
+                if held is not None:
+                    # It ends up wherever it was dropped, out of the way of later moves
+                    ignored.add(held)
+                held = held_offset = None
+                continue
+            if tool_name != "move_arm":
+                continue
+
+            end = list(tool_args["target"])
+            target_joints = self._solve(end, tool_args.get("target_orn"), joints)
+            # Descending onto an object is meant to reach it
+            excluded = set(ignored)
+            if held is not None:
+                excluded.add(held)
+            grasped = self._nearest_object(end, ignored)
+            if grasped is not None and held is None:
+                excluded.add(grasped)
+
+            carried = (self.sim.objects[held], held_offset) if held is not None else None
+            clearance, closest = self._sweep(joints, target_joints, excluded, carried)
+            segments.append({
+                "index": i, "start": start, "start_orn": start_orn, "end": end,
+                "clearance": round(clearance, 4), "closest": closest,
+                "collides": clearance < self.min_clearance,
+            })
+            joints, start, start_orn = target_joints, end, tool_args.get("target_orn")
+        return segments
+
+    def _solve(self, target, target_orn, joints):
+        target = [target[0], target[1], target[2] + END_EFFECTOR_OFFSET]
+        if target_orn is None:
+            target_orn = p.getQuaternionFromEuler([0, math.pi, 0])
+        elif len(target_orn) == 3:
+            target_orn = p.getQuaternionFromEuler(target_orn)
+        # IK starts from the current joints, as it does on the real robot
+        self._pose(joints)
+        return self.sim.solve_ik(target, target_orn)[0]
+
+    @staticmethod
+    def _tip(link):
+        """Plan target (fingertip point) for an end-effector link pose"""
+        x, y, z = link[0]
+        return [x, y, z - END_EFFECTOR_OFFSET]
+
+    def _attach(self, name, joints):
+        """The object's pose relative to the end effector, to carry it along with the gripper"""
+        cid = self.sim.client
+        link = self._pose(joints)
+        body = p.getBasePositionAndOrientation(self.sim.objects[name], physicsClientId=cid)
+        return p.multiplyTransforms(*p.invertTransform(*link), *body)
+
+    def _pose(self, joints):
+        cid = self.sim.client
+        for index, position in zip(self.sim.joint_indices, joints):
+            p.resetJointState(self.sim.kuka_id, index, position, physicsClientId=cid)
+        # The gripper hangs off a constraint, so place it where the constraint would hold it
+        link = p.getLinkState(self.sim.kuka_id, self.sim.kuka_end_effector_idx,
+                              computeForwardKinematics=True, physicsClientId=cid)[4:6]
+        gripper_link = p.multiplyTransforms(*link, *p.invertTransform(GRIPPER_CHILD_FRAME, [0, 0, 0, 1]))
+        base = p.multiplyTransforms(*gripper_link, *self._base_in_link)
+        p.resetBasePositionAndOrientation(self.sim.kuka_gripper_id, *base, physicsClientId=cid)
+        return link
+
+    def _sweep(self, start_joints, end_joints, excluded, carried=None):
+        """Smallest distance between the moving arm (and any carried object) and the other objects
+
+        carried is (body id, pose relative to the end effector) for a held object.
+        """
+        cid = self.sim.client
+        distance = float(np.max(np.abs(end_joints - start_joints)))
+        samples = max(2, min(MAX_SEGMENT_SAMPLES, math.ceil(distance / (MAX_JOINT_STEP * 20))))
+        bodies = {name: body_id for name, body_id in self.sim.objects.items() if name not in excluded}
+
+        moving = [self.sim.kuka_id, self.sim.kuka_gripper_id]
+        if carried is not None:
+            moving.append(carried[0])
+
+        clearance, closest = CLEARANCE_QUERY_DISTANCE, None
+        fingertips = []
+        for poses in np.linspace(start_joints, end_joints, samples):
+            link = self._pose(poses)
+            fingertips.append(self._tip(link))
+            if carried is not None:
+                body_id, offset = carried
+                p.resetBasePositionAndOrientation(
+                    body_id, *p.multiplyTransforms(*link, *offset), physicsClientId=cid)
+            for name, body_id in bodies.items():
+                for robot_id in moving:
+                    points = p.getClosestPoints(robot_id, body_id, CLEARANCE_QUERY_DISTANCE,
+                                                physicsClientId=cid)
+                    for point in points:
+                        # contactDistance, negative when penetrating
+                        if point[8] < clearance:
+                            clearance, closest = point[8], name
+
+        # Between samples the fingertips could pass through something thin
+        ray_from, ray_to = [], []
+        for a, b in zip(fingertips, fingertips[1:]):
+            for dx, dy in ((0, 0), (FINGER_SPREAD, 0), (-FINGER_SPREAD, 0),
+                           (0, FINGER_SPREAD), (0, -FINGER_SPREAD)):
+                ray_from.append([a[0] + dx, a[1] + dy, a[2]])
+                ray_to.append([b[0] + dx, b[1] + dy, b[2]])
+        if ray_from:
+            names = {body_id: name for name, body_id in bodies.items()}
+            for hit in p.rayTestBatch(ray_from, ray_to, physicsClientId=cid):
+                if hit[0] in names:
+                    clearance, closest = min(clearance, 0.0), names[hit[0]]
+        return clearance, closest
+
+    def _nearest_object(self, point, ignored):
+        best, best_distance = None, GRASP_RADIUS
+        for name, position in self.sim.object_positions().items():
+            if name == "container" or name in ignored:
+                continue
+            distance = math.dist(point[:2], position[:2])
+            if distance < best_distance:
+                best, best_distance = name, distance
+        return best
+
+    def _lift_waypoints(self, segment, tool_args):
+        """Rise straight up, cross over everything in the way, then come down onto the target"""
+        cid = self.sim.client
+        start, end = segment["start"], segment["end"]
+        tallest = max(p.getAABB(body_id, physicsClientId=cid)[1][2]
+                      for body_id in self.sim.objects.values())
+        safe_z = max(start[2], end[2], tallest + LIFT_CLEARANCE)
+        waypoints = [{"target": [start[0], start[1], safe_z]},
+                     {"target": [end[0], end[1], safe_z]}]
+        # Keep the orientation while rising, turn to the new one while crossing
+        for waypoint, orn in zip(waypoints, (segment["start_orn"], tool_args.get("target_orn"))):
+            if orn is not None:
+                waypoint["target_orn"] = list(orn)
+        return waypoints
@@ -0,0 +1,94 @@
+import math
+import re
+
+HOVER_HEIGHT = 0.25
+LIFT_HEIGHT = 0.3
+DROP_HEIGHT = 0.3
+
+PICK_VERBS = {"put", "place", "drop", "move", "throw", "toss", "pick",
+              "bring", "take", "stick", "load", "get", "grab", "transfer"}
+CONTAINER_WORDS = {"container", "bin", "basket", "bucket"}
+# One of these must lead up to the container word: "in the bin", "into the basket"
+DESTINATION_WORDS = {"in", "into", "inside", "to"}
+# Anything that suggests more than plain pick-and-place goes to the LLM
+UNSUPPORTED_WORDS = {"not", "dont", "don", "never", "except", "unless", "if",
+                     "stack", "push", "top", "next", "beside", "under", "behind",
+                     "between", "near", "all", "everything", "every", "out", "remove",
+                     "and", "then", "also", "on", "onto", "table", "floor"}
+
+stats = {"hits": 0, "misses": 0}
+
+
+def _words(transcript):
+    return re.sub(r"[^a-z ]+", " ", transcript.lower()).split()
+
+
+def grasp_orientation(obj):
+    """Pick the gripper yaw across the object's short side, as the planner prompt describes"""
+    if obj.get("y") == "short":
+        return [0, math.pi, math.pi / 2]
+    if obj.get("x") == "short":
+        return [0, math.pi, 0]
+    return None
+
+
+def match_objects(transcript, data):
+    """The object to put in the container, as a one-item list, or None if the command doesn't fit
+
+    Only "<verb> the <object> in the container" is handled here; a second
+    object or a second destination could belong to a different action, so
+    those commands go to the LLM.
+    """
+    words = _words(transcript)
+    if not PICK_VERBS.intersection(words) or UNSUPPORTED_WORDS.intersection(words):
+        return None
+
+    by_name = {obj["Object"].lower(): obj for obj in data}
+    container_at = [i for i, w in enumerate(words) if w in CONTAINER_WORDS]
+    if "container" not in by_name or len(container_at) != 1:
+        return None
+    if not DESTINATION_WORDS.intersection(words[max(0, container_at[0] - 2):container_at[0]]):
+        return None
+
+    mentions = []
+    for i, word in enumerate(words):
+        name = word if word in by_name else word.rstrip("s")
+        if name in by_name and name != "container":
+            mentions.append((i, by_name[name]))
+    if len(mentions) != 1:
+        return None
+    i, target = mentions[0]
+    # The destination must come after the object we are asked to move
+    if i > container_at[0]:
+        return None
+    return [target]
+
+
+def plan_locally(data, transcript):
+    """Build the pick-and-place command list without the LLM, or return None"""
+    targets = match_objects(transcript, data)
+    orientations = [grasp_orientation(obj) for obj in targets or []]
+    if not targets or None in orientations:
+        stats["misses"] += 1
+        return None
+
+    container = next(obj for obj in data if obj["Object"] == "container")
+    cx, cy, cz = container["location"]
+    plan = []
+    for obj, orn in zip(targets, orientations):
+        x, y, z = obj["location"]
+        plan += [
+            "move_arm", {"target": [x, y, z + HOVER_HEIGHT], "target_orn": orn},
+            "move_arm", {"target": [x, y, z], "target_orn": orn},
+            "close_gripper", {},
+            "move_arm", {"target": [x, y, z + LIFT_HEIGHT], "target_orn": orn},
+            "move_arm", {"target": [cx, cy, cz + DROP_HEIGHT], "target_orn": orn},
+            "open_gripper", {},
+        ]
+    stats["hits"] += 1
+    return plan
+
+
+def hit_rate():
+    total = stats["hits"] + stats["misses"]
+    return stats["hits"] / total if total else 0.0
@@ -0,0 +1,150 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Each stage saturates a different resource (CPU/GPU, API quota, the one arm)
+STAGE_LIMITS = {
+    "asr": int(os.environ.get("ASR_CONCURRENCY", "1")),
+    "llm": int(os.environ.get("LLM_CONCURRENCY", "4")),
+    "robot": int(os.environ.get("ROBOT_CONCURRENCY", "1")),
+}
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "8"))
+MAX_PENDING_JOBS = int(os.environ.get("MAX_PENDING_JOBS", "64"))
+MAX_FINISHED_JOBS = 500
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = "queued"
+        self.stage = None
+        self.events = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.changed = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ("succeeded", "failed")
+
+    def update(self, **fields):
+        with self.changed:
+            for key, value in fields.items():
+                setattr(self, key, value)
+            self.events.append({
+                "time": time.time(),
+                "status": self.status,
+                "stage": self.stage,
+                **({"message": fields["message"]} if "message" in fields else {})
+            })
+            self.changed.notify_all()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "events": list(self.events),
+        }
+
+
+class JobManager:
+    """Runs multi-stage jobs on a bounded pool with per-stage concurrency limits"""
+
+    def __init__(self, stage_limits=STAGE_LIMITS, max_workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS):
+        self.stage_limits = dict(stage_limits)
+        self.max_pending = max_pending
+        self._slots = {name: threading.BoundedSemaphore(limit)
+                       for name, limit in self.stage_limits.items()}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @contextmanager
+    def stage_slot(self, stage):
+        """Hold one of the stage's concurrency slots, also usable outside jobs"""
+        slot = self._slots[stage]
+        slot.acquire()
+        try:
+            yield
+        finally:
+            slot.release()
+
+    @contextmanager
+    def stage(self, job, stage):
+        job.update(stage=stage, status="waiting")
+        with self.stage_slot(stage):
+            job.update(status="running")
+            yield
+
+    def submit(self, name, pipeline, *args):
+        """Queue pipeline(job, *args); its return value becomes the job result"""
+        job = Job(name)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(
+                    f"{self._pending} jobs already pending")
+            self._pending += 1
+            self._jobs[job.id] = job
+            self._trim()
+        job.update()
+        # Carry the submitting request's context (and so its trace) into the worker
+        context = contextvars.copy_context()
+        self._executor.submit(context.run, self._run, job, pipeline, args)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def follow(self, job, heartbeat=15):
+        """Yield new events as they happen (None as a heartbeat) until the job finishes"""
+        sent = 0
+        while True:
+            with job.changed:
+                if sent == len(job.events) and not job.done:
+                    job.changed.wait(timeout=heartbeat)
+                new_events = job.events[sent:]
+                sent = len(job.events)
+                done = job.done
+            if not new_events:
+                yield None
+            for event in new_events:
+                yield event
+            if done:
+                return
+
+    def _run(self, job, pipeline, args):
+        try:
+            result = pipeline(job, *args)
+            job.update(status="succeeded", stage=None, result=result,
+                       finished_at=time.time())
+        except Exception as e:
+            job.update(status="failed", error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
@@ -0,0 +1,235 @@
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+import anthropic
+import tracing
+
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.environ.get("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "16"))
+# Start a second sample if the first hasn't produced a usable plan by then (0 = off)
+LLM_HEDGE_AFTER_SECONDS = float(os.environ.get("LLM_HEDGE_AFTER_SECONDS", "0"))
+
+# Worth another attempt; anything else (bad request, auth) fails straight away
+RETRYABLE_ERRORS = (
+    anthropic.APIConnectionError,  # includes APITimeoutError
+    anthropic.RateLimitError,
+    anthropic.InternalServerError,
+)
+
+
+class LLMDeadlineExceeded(Exception):
+    pass
+
+
+_TEXT = object()
+_DONE = object()
+
+
+class LLMStream:
+    """A streamed messages call running on the client's loop, read from a synchronous thread
+
+    Mirrors the SDK's MessageStream: iterate text_stream, then call
+    get_final_message(). Use it as a context manager so an abandoned stream
+    is cancelled.
+    """
+
+    def __init__(self, llm, deadline, kwargs):
+        self._llm = llm
+        self._deadline = deadline
+        self._chunks = queue.Queue()
+        self._message = None
+        self._future = None
+        self._kwargs = kwargs
+
+    def __enter__(self):
+        self._future = self._llm._submit(self._produce())
+        self._future.add_done_callback(lambda f: self._chunks.put((_DONE, f)))
+        return self
+
+    def __exit__(self, *exc):
+        self._future.cancel()
+
+    @property
+    def text_stream(self):
+        while True:
+            try:
+                kind, value = self._chunks.get(timeout=max(0, self._deadline - time.monotonic()))
+            except queue.Empty:
+                self._future.cancel()
+                raise LLMDeadlineExceeded("Stream stalled past its deadline") from None
+            if kind is _DONE:
+                self._message = value.result()
+                return
+            yield value
+
+    def get_final_message(self):
+        if self._message is None:
+            for _ in self.text_stream:
+                pass
+        return self._message
+
+    async def _produce(self):
+        llm = self._llm
+        attempt = 0
+        while True:
+            remaining = self._deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMDeadlineExceeded(f"No response within the deadline after {attempt} attempts")
+            llm.stats["calls"] += 1
+            started = False
+            try:
+                async with llm.client.messages.stream(timeout=remaining, **self._kwargs) as stream:
+                    async for text in stream.text_stream:
+                        started = True
+                        self._chunks.put((_TEXT, text))
+                    return await stream.get_final_message()
+            except RETRYABLE_ERRORS as e:
+                # Once text is out the caller may have acted on it, so only a clean start is retried
+                if started:
+                    raise
+                attempt += 1
+                await llm._retry_wait(attempt, self._deadline, e)
+
+
+class AsyncLLMClient:
+    """AsyncAnthropic on a background event loop shared by every Flask thread
+
+    Requests reuse one pooled HTTP connection set, each call has a deadline
+    covering all of its retries, and run() lets synchronous code wait on a
+    coroutine. Pass client= to use a stub with the same messages interface.
+    """
+
+    def __init__(self, api_key=None, timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES,
+                 max_connections=LLM_MAX_CONNECTIONS, client=None, log=print):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.log = log
+        self.client = client
+        self.stats = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0}
+        self._loop = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return self
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name="llm-client",
+                             daemon=True).start()
+            if self.client is None:
+                self.client = anthropic.AsyncAnthropic(
+                    api_key=self.api_key,
+                    # Retries are handled in create() so they share its deadline
+                    max_retries=0,
+                    # Built from the SDK's own classes: newer SDKs reject a plain httpx client
+                    http_client=anthropic.DefaultAsyncHttpxClient(
+                        limits=type(anthropic.DEFAULT_CONNECTION_LIMITS)(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections),
+                        timeout=self.timeout))
+        return self
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the client's loop and wait for its result"""
+        future = self._submit(coro)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def _submit(self, coro):
+        self.start()
+        parent = tracing.trace_parent()
+
+        async def in_trace():
+            # Spans opened on the loop join the calling thread's trace
+            with tracing.attach(parent):
+                return await coro
+
+        return asyncio.run_coroutine_threadsafe(in_trace(), self._loop)
+
+    async def create(self, deadline=None, **kwargs):
+        """messages.create with jittered exponential backoff, all within deadline"""
+        deadline = deadline or time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMDeadlineExceeded(f"No response within the deadline after {attempt} attempts")
+            self.stats["calls"] += 1
+            try:
+                return await self.client.messages.create(timeout=remaining, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                await self._retry_wait(attempt, deadline, e)
+
+    def stream(self, deadline=None, **kwargs):
+        """messages.stream on the client's loop, with create()'s deadline and retries"""
+        return LLMStream(self, deadline or time.monotonic() + self.timeout, kwargs)
+
+    async def _retry_wait(self, attempt, deadline, error):
+        """Sleep before retry number attempt, or re-raise error if out of retries or time"""
+        if attempt > self.max_retries:
+            raise error
+        # Full jitter so concurrent callers don't retry in lockstep
+        delay = random.uniform(0, LLM_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+        if time.monotonic() + delay >= deadline:
+            raise error
+        self.stats["retries"] += 1
+        self.log(f"⚠️ LLM call failed ({type(error).__name__}), retry {attempt} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    async def hedged(self, attempt, accept=bool, hedge_after=LLM_HEDGE_AFTER_SECONDS):
+        """Run attempt(), starting a second copy if the first is slow or unusable
+
+        Returns the first result that accept() takes, or the last result if
+        neither does. With hedge_after 0 this is just one attempt.
+        """
+        if hedge_after <= 0:
+            return await attempt()
+
+        primary = asyncio.ensure_future(attempt())
+        running = {primary}
+        hedge = None
+        result = None
+        try:
+            while running:
+                timeout = hedge_after if hedge is None else None
+                done, running = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        self.log(f"⚠️ LLM sample failed: {task.exception()}")
+                        continue
+                    result = task.result()
+                    if accept(result):
+                        if task is hedge:
+                            self.stats["hedge_wins"] += 1
+                        return result
+                if hedge is None:
+                    # Primary too slow, or finished with nothing usable
+                    self.stats["hedges"] += 1
+                    hedge = asyncio.ensure_future(attempt())
+                    running.add(hedge)
+            if primary.exception() is not None and (hedge is None or hedge.exception() is not None):
+                raise primary.exception()
+            return result
+        finally:
+            for task in running:
+                task.cancel()
+
+    def close(self):
+        if self._loop is None:
+            return
+        if hasattr(self.client, "close"):
+            asyncio.run_coroutine_threadsafe(self.client.close(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
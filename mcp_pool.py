@@ -0,0 +1,251 @@
+import asyncio
+import concurrent.futures
+import os
+import sys
+import threading
+from contextlib import AsyncExitStack
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+import tracing
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+MCP_POOL_SIZE = int(os.environ.get("MCP_POOL_SIZE", "1"))
+HEALTH_CHECK_SECONDS = float(os.environ.get("MCP_HEALTH_CHECK_SECONDS", "15"))
+PING_TIMEOUT_SECONDS = 5
+RECONNECT_BACKOFF_SECONDS = [0.5, 1, 2, 5, 10]
+# Longest a caller waits for a plan, including time queued while reconnecting
+PLAN_TIMEOUT_SECONDS = float(os.environ.get("MCP_PLAN_TIMEOUT_SECONDS", "120"))
+
+
+class ToolCallError(Exception):
+    pass
+
+
+class PlanAborted(ToolCallError):
+    pass
+
+
+class PlanTimeout(ToolCallError):
+    pass
+
+
+_END = object()
+_ABORT = object()
+
+
+class PlanStream:
+    """Steps of one plan, fed in as they become available and run in order"""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._steps = asyncio.Queue()
+        self.future = concurrent.futures.Future()
+        self.aborted = threading.Event()
+        # Tool calls run on the pool's loop, outside the caller's context
+        self.trace_parent = tracing.trace_parent()
+
+    def send(self, tool_name, tool_args):
+        self._put((tool_name, tool_args))
+
+    def close(self):
+        """No more steps: finish once the queued ones have run"""
+        self._put(_END)
+
+    def abort(self):
+        """Skip whatever has not started yet, including steps already queued"""
+        self.aborted.set()
+        # Wake the worker if it is waiting for the next step
+        self._put(_ABORT)
+
+    def result(self, timeout=PLAN_TIMEOUT_SECONDS):
+        """The tool outputs, or PlanTimeout if no connection finished the plan in time"""
+        try:
+            return self.future.result(timeout)
+        except concurrent.futures.TimeoutError as e:
+            # Don't let it run later, whenever a connection comes back
+            if not self.future.cancel():
+                self.abort()
+            raise PlanTimeout(f"Plan did not finish within {timeout}s") from e
+
+    def _put(self, item):
+        self._pool._loop.call_soon_threadsafe(self._steps.put_nowait, item)
+
+
+class RobotSessionPool:
+    """Long-lived MCP sessions to server.py shared by every Flask thread
+
+    Each connection owns one server.py process (and so one RobotSim); plans
+    wait in a queue and run start-to-finish on whichever connection is free.
+    Read-only calls (read_tool) skip the queue and go straight to a session.
+    """
+
+    def __init__(self, size=MCP_POOL_SIZE, log=print, health_interval=HEALTH_CHECK_SECONDS):
+        self.size = size
+        self.log = log
+        self.health_interval = health_interval
+        self.server_params = StdioServerParameters(
+            command=sys.executable, args=["server.py"], cwd=SERVER_DIR,
+            env=dict(os.environ))
+        self.connected = [False] * size
+        self._sessions = [None] * size
+        self._loop = None
+        self._queue = None
+        self._workers = []
+        self._started = threading.Event()
+        self._start_lock = threading.Lock()
+        self._closing = False
+
+    def start(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._run_loop, name="mcp-pool",
+                             daemon=True).start()
+        self._started.wait()
+
+    def is_healthy(self):
+        return any(self.connected)
+
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def open_stream(self):
+        """Queue a plan whose steps will be sent while it is already running"""
+        self.start()
+        stream = PlanStream(self)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, stream)
+        return stream
+
+    def submit(self, plan):
+        """Queue a complete plan, returning a concurrent Future with the tool outputs"""
+        return self._queue_plan(plan).future
+
+    def run_plan(self, plan, timeout=PLAN_TIMEOUT_SECONDS):
+        return self._queue_plan(plan).result(timeout)
+
+    def call_tool(self, tool_name, tool_args=None, timeout=PLAN_TIMEOUT_SECONDS):
+        """Run a single tool call, returning its text output"""
+        return self.run_plan([tool_name, tool_args or {}], timeout)[0]
+
+    def read_tool(self, tool_name, tool_args=None, timeout=PING_TIMEOUT_SECONDS):
+        """Run a tool that moves nothing right away, alongside any running plan
+
+        It doesn't wait in the plan queue; server.py's tools are synchronous,
+        so it waits at most for the step in progress.
+        """
+        self.start()
+        session = next((s for s in self._sessions if s is not None), None)
+        if session is None:
+            raise ToolCallError(f"No MCP connection for {tool_name}")
+        future = asyncio.run_coroutine_threadsafe(
+            self._call_tool(session, tool_name, tool_args or {}, tracing.trace_parent()),
+            self._loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError as e:
+            future.cancel()
+            raise ToolCallError(f"{tool_name} did not answer within {timeout}s") from e
+
+    def close(self):
+        if self._loop is None:
+            return
+        self._closing = True
+        for task in self._workers:
+            self._loop.call_soon_threadsafe(task.cancel)
+
+    def _queue_plan(self, plan):
+        stream = self.open_stream()
+        for i in range(0, len(plan), 2):
+            if i + 1 < len(plan):
+                stream.send(plan[i], plan[i + 1])
+        stream.close()
+        return stream
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._workers = [self._loop.create_task(self._worker(i))
+                         for i in range(self.size)]
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _worker(self, index):
+        attempt = 0
+        while not self._closing:
+            try:
+                async with AsyncExitStack() as stack:
+                    read, write = await stack.enter_async_context(
+                        stdio_client(self.server_params))
+                    session = await stack.enter_async_context(
+                        ClientSession(read, write))
+                    await session.initialize()
+                    self.connected[index] = True
+                    self._sessions[index] = session
+                    attempt = 0
+                    self.log(f"✅ Connected to MCP server (connection {index})")
+                    await self._serve(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.log(f"❌ MCP connection {index} lost: {e}")
+            finally:
+                self.connected[index] = False
+                self._sessions[index] = None
+
+            delay = RECONNECT_BACKOFF_SECONDS[min(
+                attempt, len(RECONNECT_BACKOFF_SECONDS) - 1)]
+            attempt += 1
+            self.log(f"🔄 Reconnecting MCP connection {index} in {delay}s")
+            await asyncio.sleep(delay)
+
+    async def _serve(self, session):
+        while True:
+            try:
+                stream = await asyncio.wait_for(
+                    self._queue.get(), timeout=self.health_interval)
+            except asyncio.TimeoutError:
+                # Idle: make sure the server is still alive before the next plan arrives
+                await asyncio.wait_for(session.send_ping(), timeout=PING_TIMEOUT_SECONDS)
+                continue
+
+            future = stream.future
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                results = await self._execute(session, stream)
+            except ToolCallError as e:
+                future.set_exception(e)
+            except BaseException as e:
+                # Transport failure: fail this plan and let the worker reconnect
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(results)
+
+    async def _execute(self, session, stream):
+        results = []
+        # Execute each tool call as it arrives
+        while True:
+            step = await stream._steps.get()
+            if step is _ABORT or stream.aborted.is_set():
+                raise PlanAborted(
+                    f"Plan aborted after {len(results)} completed steps")
+            if step is _END:
+                return results
+
+            tool_name, tool_args = step
+            self.log(f"🔧 Executing {tool_name} with args: {tool_args}")
+            output = await self._call_tool(session, tool_name, tool_args, stream.trace_parent)
+            self.log(f"✅ {tool_name} completed: {output}")
+            results.append(output)
+
+    async def _call_tool(self, session, tool_name, tool_args, trace_parent):
+        with tracing.span(f"tool:{tool_name}", parent=trace_parent):
+            # server.py continues the trace under this span
+            result = await session.call_tool(
+                tool_name, dict(tool_args, trace_parent=tracing.trace_parent()))
+        output = result.content[0].text if result.content else 'No output'
+        if result.isError:
+            raise ToolCallError(f"{tool_name} failed: {output}")
+        return output
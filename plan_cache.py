@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+PLAN_CACHE_SIZE = int(os.environ.get("PLAN_CACHE_SIZE", "256"))
+PLAN_CACHE_TTL_SECONDS = float(os.environ.get("PLAN_CACHE_TTL_SECONDS", "3600"))
+# Set to a file path to keep plans across restarts
+PLAN_CACHE_PATH = os.environ.get("PLAN_CACHE_PATH")
+# Locations are rounded to this many decimals before hashing (1 mm)
+LOCATION_DECIMALS = 3
+
+FILLER_WORDS = {"the", "a", "an", "please", "can", "you", "could", "would", "now"}
+
+
+def normalize_command(text):
+    words = re.sub(r"[^a-z0-9 ]+", " ", text.lower()).split()
+    return " ".join(w for w in words if w not in FILLER_WORDS)
+
+
+def _object_fingerprint(obj):
+    location = [round(float(v), LOCATION_DECIMALS) for v in obj["location"]]
+    payload = json.dumps([obj["Object"], location, obj.get("x"), obj.get("y")])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def relevant_objects(command, data):
+    """Objects a plan for this command depends on: the ones it names plus the container"""
+    words = set(normalize_command(command).split())
+    named = [obj for obj in data
+             if obj["Object"].lower() in words or obj["Object"] == "container"]
+    # Without any named object every object may matter
+    return named if len(named) > 1 else list(data)
+
+
+def scene_fingerprint(objects):
+    parts = sorted(_object_fingerprint(obj) for obj in objects)
+    return hashlib.sha1("".join(parts).encode()).hexdigest()
+
+
+class PlanCache:
+    """LRU + TTL memo of plans keyed on normalized command and scene fingerprint"""
+
+    def __init__(self, max_entries=PLAN_CACHE_SIZE, ttl=PLAN_CACHE_TTL_SECONDS, path=PLAN_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._object_fps = {}
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS plans (key TEXT PRIMARY KEY, objects TEXT, plan TEXT, created REAL)")
+            self._db.commit()
+
+    def key(self, command, data):
+        fp = scene_fingerprint(relevant_objects(command, data))
+        return hashlib.sha1(f"{normalize_command(command)}|{fp}".encode()).hexdigest()
+
+    def get(self, command, data):
+        self.sync_scene(data)
+        key = self.key(command, data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load(key)
+            if entry is not None and time.time() - entry["created"] > self.ttl:
+                self._delete(key)
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry["plan"]
+
+    def put(self, command, data, plan):
+        key = self.key(command, data)
+        entry = {
+            "objects": sorted(obj["Object"] for obj in relevant_objects(command, data)),
+            "plan": plan,
+            "created": time.time(),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO plans VALUES (?, ?, ?, ?)",
+                                 (key, json.dumps(entry["objects"]), json.dumps(plan), entry["created"]))
+                self._db.commit()
+
+    def sync_scene(self, data):
+        """Drop every entry that depends on an object whose location changed"""
+        current = {obj["Object"]: _object_fingerprint(obj) for obj in data}
+        with self._lock:
+            changed = {name for name, fp in current.items()
+                       if name in self._object_fps and self._object_fps[name] != fp}
+            self._object_fps = current
+            if not changed:
+                return
+            for key, entry in list(self._entries.items()):
+                if changed.intersection(entry["objects"]):
+                    self._delete(key)
+            if self._db is not None:
+                for key, objects in self._db.execute("SELECT key, objects FROM plans").fetchall():
+                    if changed.intersection(json.loads(objects)):
+                        self._delete(key)
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def _load(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT objects, plan, created FROM plans WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return {"objects": json.loads(row[0]), "plan": json.loads(row[1]), "created": row[2]}
+
+    def _delete(self, key):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM plans WHERE key = ?", (key,))
+            self._db.commit()
+        self.stats["invalidations"] += 1
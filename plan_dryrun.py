@@ -0,0 +1,153 @@
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+DRYRUN_CANDIDATES = int(os.environ.get("DRYRUN_CANDIDATES", "0"))
+DRYRUN_WORKERS = int(os.environ.get("DRYRUN_WORKERS", "4"))
+# Total time for sampling candidates and simulating them
+DRYRUN_BUDGET_SECONDS = float(os.environ.get("DRYRUN_BUDGET_SECONDS", "20"))
+
+# Set in each worker process by _init_worker
+_sim = None
+
+
+def _init_worker():
+    global _sim
+    from robot_controller import RobotSim
+    _sim = RobotSim(mode="direct")
+
+
+def _ping():
+    return os.getpid()
+
+
+def _dry_run(plan, targets, positions, arm_joints=None):
+    """Run a plan from the snapshot in this worker's headless sim and measure the outcome"""
+    _sim.reset()
+    if arm_joints is not None:
+        # Start where the live arm is, before the objects go back into place
+        _sim.set_arm_joints(arm_joints)
+    if positions:
+        _sim.place_objects({name: position for name, position in positions.items()
+                            if name in _sim.objects})
+    before = _sim.object_positions()
+
+    steps = 0
+    completed = True
+    for i in range(0, len(plan) - 1, 2):
+        tool_name, tool_args = plan[i], plan[i + 1]
+        if tool_name == "move_arm":
+            result = _sim.move_arm(
+                tool_args["target"], tool_args.get("target_orn"))
+            completed = completed and result["converged"]
+        else:
+            result = getattr(_sim, tool_name)()
+        steps += result["steps"]
+    _sim.settle()
+
+    after = _sim.object_positions()
+    disturbance = sum(math.dist(before[name], after[name])
+                      for name in before if name not in targets and name != "container")
+    return {
+        "delivered": sum(_sim.object_in_container(name) for name in targets),
+        "targets": len(targets),
+        "disturbance": disturbance,
+        "steps": steps,
+        "converged": completed,
+    }
+
+
+def _score(outcome):
+    # Most targets delivered, then every move converged, then least disturbance, then fewest steps
+    return (-outcome["delivered"], not outcome["converged"],
+            round(outcome["disturbance"], 3), outcome["steps"])
+
+
+def command_targets(data, prompt):
+    words = set(re.sub(r"[^a-z ]+", " ", prompt.lower()).split())
+    return [obj["Object"] for obj in data
+            if obj["Object"] != "container" and (obj["Object"] in words or obj["Object"] + "s" in words)]
+
+
+class PlanDryRunner:
+    """Samples candidate plans and keeps the one that does best in headless simulation"""
+
+    def __init__(self, workers=DRYRUN_WORKERS, log=print):
+        self.workers = workers
+        self.log = log
+        self._pool = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start and warm up the simulator processes"""
+        with self._start_lock:
+            if self._pool is None:
+                # Spawn rather than fork: the app already runs the MCP loop, Whisper
+                # and Flask threads, and a forked child could inherit a held lock
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_init_worker,
+                    mp_context=multiprocessing.get_context("spawn"))
+                concurrent.futures.wait(
+                    [self._pool.submit(_ping) for _ in range(self.workers)])
+        return self
+
+    def select(self, data, prompt, candidates=DRYRUN_CANDIDATES, budget=DRYRUN_BUDGET_SECONDS,
+               arm_joints=None):
+        """Return (plan, report) for the best of several sampled plans
+
+        arm_joints, the live arm's joint positions, is where each dry run starts.
+        """
+        # Deferred so this module imports without anthropic installed. It doesn't
+        # keep the LLM client out of the workers: spawn re-imports the app's main module
+        from LLMPipeline import lookup_plan, plan_cache, sample_plan
+
+        plan = lookup_plan(data, prompt)
+        if plan is not None:
+            return plan, {"source": "cache"}
+
+        deadline = time.monotonic() + budget
+        self.start()
+        sampler = ThreadPoolExecutor(max_workers=candidates)
+        sampling = [sampler.submit(sample_plan, data, prompt)
+                    for _ in range(candidates)]
+        done, _ = concurrent.futures.wait(
+            sampling, timeout=max(0, deadline - time.monotonic()))
+        # Late samples are abandoned rather than waited for
+        sampler.shutdown(wait=False, cancel_futures=True)
+        plans = [f.result() for f in done if f.exception() is None and f.result()]
+        if not plans:
+            return None, {"source": "llm", "candidates": 0}
+
+        targets = command_targets(data, prompt)
+        positions = {obj["Object"]: obj["location"] for obj in data}
+        runs = {self._pool.submit(_dry_run, plan, targets, positions, arm_joints): plan
+                for plan in plans}
+        done, _ = concurrent.futures.wait(
+            runs, timeout=max(0, deadline - time.monotonic()))
+
+        outcomes = [(f.result(), runs[f]) for f in done if f.exception() is None]
+        report = {"source": "llm", "candidates": len(plans),
+                  "simulated": len(outcomes), "targets": targets}
+        if not outcomes:
+            # Out of budget: fall back to the first plan, unverified
+            self.log(f"⚠️ No dry run finished within {budget}s")
+            return plans[0], report
+
+        outcome, best = min(outcomes, key=lambda item: _score(item[0]))
+        report["best"] = outcome
+        self.log(f"🧪 Picked plan delivering {outcome['delivered']}/{outcome['targets']} "
+                 f"targets, disturbance {outcome['disturbance']:.3f} m, {outcome['steps']} steps")
+        # Without named targets, "all delivered" would say nothing about the plan
+        if targets and outcome["delivered"] == len(targets) and outcome["converged"]:
+            plan_cache.put(prompt, data, best)
+        return best, report
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,220 @@
+import itertools
+import math
+import os
+
+# Off switch in case a plan relies on the model's exact ordering. Applies to
+# whole plans only; steps streamed to the robot as they are parsed skip it
+PLAN_OPTIMIZER = os.environ.get("PLAN_OPTIMIZER", "1") == "1"
+# Also drop waypoints on the straight line between their neighbours. Off by
+# default: RobotSim.move_arm interpolates in joint space, so the gripper does
+# not follow that line and the middle waypoint (often a deliberate lift)
+# changes the path it sweeps
+DROP_COLLINEAR = os.environ.get("PLAN_OPTIMIZER_COLLINEAR", "0") == "1"
+# Targets closer than this are the same pose
+POSE_TOLERANCE = 0.005  # m
+ORN_TOLERANCE = 0.01  # rad
+# How far a waypoint may sit off the straight line and still be dropped
+COLLINEAR_TOLERANCE = 0.005  # m
+# Picks this close together may be stacked, so their order is kept
+STACK_RADIUS = 0.1  # m
+# Exhaustive reordering up to this many pick-and-place units, greedy beyond
+MAX_EXHAUSTIVE_UNITS = 6
+# Move cost proxy shaped like RobotSim.move_arm's step count (a per-step joint
+# limit, clamped); it is fed meters, not radians, so it only ranks plans
+COST_PER_METER = 1 / 0.005
+MIN_MOVE_COST = 20
+MAX_MOVE_COST = 700
+
+stats = {"plans": 0, "moves_removed": 0, "reordered": 0, "cost_saved": 0}
+
+
+def move_cost(distance):
+    """Rough relative cost of one move of this Cartesian length, not a simulation step count"""
+    return min(MAX_MOVE_COST, max(MIN_MOVE_COST, math.ceil(distance * COST_PER_METER)))
+
+
+def _pairs(plan):
+    return [(plan[i], plan[i + 1]) for i in range(0, len(plan) - 1, 2)]
+
+
+def _flatten(pairs):
+    return [item for pair in pairs for item in pair]
+
+
+def _same_orn(a, b):
+    a, b = a.get("target_orn"), b.get("target_orn")
+    if a is None or b is None:
+        return a is b
+    return len(a) == len(b) and all(abs(x - y) <= ORN_TOLERANCE for x, y in zip(a, b))
+
+
+def _same_pose(a, b):
+    return math.dist(a["target"], b["target"]) <= POSE_TOLERANCE and _same_orn(a, b)
+
+
+def _off_segment(point, start, end):
+    """Distance from point to the segment start-end"""
+    seg = [e - s for s, e in zip(start, end)]
+    length_sq = sum(c * c for c in seg)
+    if length_sq == 0:
+        return math.dist(point, start)
+    t = sum((p - s) * c for p, s, c in zip(point, start, seg)) / length_sq
+    if not 0 <= t <= 1:
+        return math.inf
+    return math.dist(point, [s + t * c for s, c in zip(start, seg)])
+
+
+def drop_redundant_moves(pairs, collinear=DROP_COLLINEAR):
+    """Drop repeated poses, and with collinear also waypoints on the line between their neighbours
+
+    Only runs of move_arm calls are touched; gripper calls always stay where they are.
+    """
+    result = []
+    for name, args in pairs:
+        if name == "move_arm" and result and result[-1][0] == "move_arm":
+            previous = result[-1][1]
+            if _same_pose(previous, args):
+                continue
+            if collinear and len(result) >= 2 and result[-2][0] == "move_arm":
+                before = result[-2][1]
+                # The targets line up, though the joint-space path between them may not
+                if _same_orn(before, previous) and _same_orn(previous, args) and _off_segment(
+                        previous["target"], before["target"], args["target"]) <= COLLINEAR_TOLERANCE:
+                    result.pop()
+        result.append((name, args))
+    return result
+
+
+def _units(pairs):
+    """Split the plan into segments ending at each open_gripper"""
+    units, current = [], []
+    for pair in pairs:
+        current.append(pair)
+        if pair[0] == "open_gripper":
+            units.append(current)
+            current = []
+    if current:
+        units.append(current)
+    return units
+
+
+def _pick_point(unit):
+    """Where a single pick-and-place unit grasps its object, or None if it is something else"""
+    names = [name for name, _ in unit]
+    if names.count("close_gripper") != 1 or names.count("open_gripper") != 1 or names[-1] != "open_gripper":
+        return None
+    grasp = None
+    for name, args in unit:
+        if name == "close_gripper":
+            return grasp
+        if name == "move_arm":
+            grasp = args["target"]
+    return None
+
+
+def _moves(pairs):
+    return [args["target"] for name, args in pairs if name == "move_arm"]
+
+
+def travel(pairs, start=None):
+    """Total Cartesian distance between consecutive move targets"""
+    points = ([start] if start else []) + _moves(pairs)
+    return sum(math.dist(a, b) for a, b in zip(points, points[1:]))
+
+
+def _keeps_stack_order(order, picks):
+    for later, i in enumerate(order):
+        for j in order[later + 1:]:
+            if j < i and math.dist(picks[i][:2], picks[j][:2]) <= STACK_RADIUS:
+                return False
+    return True
+
+
+def _best_order(units, picks, start):
+    def cost(order):
+        return travel([pair for i in order for pair in units[i]], start)
+
+    indices = list(range(len(units)))
+    if len(units) <= MAX_EXHAUSTIVE_UNITS:
+        orders = [order for order in itertools.permutations(indices)
+                  if _keeps_stack_order(order, picks)]
+        best = list(min(orders, key=cost))
+        # Keep the model's order unless another one is actually shorter
+        return best if cost(best) < cost(indices) - POSE_TOLERANCE else indices
+
+    # Greedy: always pick up the object nearest to where the arm is
+    order, remaining, position = [], indices, start
+    while remaining:
+        ready = [i for i in remaining
+                 if all(math.dist(picks[i][:2], picks[j][:2]) > STACK_RADIUS
+                        for j in remaining if j < i)]
+        nearest = min(ready, key=lambda i: math.dist(position, picks[i]) if position else 0)
+        order.append(nearest)
+        remaining = [i for i in remaining if i != nearest]
+        position = _moves(units[nearest])[-1]
+    return order
+
+
+def reorder_units(pairs):
+    """Reorder consecutive independent pick-and-place units to shorten the arm's travel
+
+    Returns (pairs, whether the order changed).
+    """
+    result = []
+    run = []
+    position = None
+    reordered = False
+
+    def flush():
+        nonlocal position, reordered
+        if len(run) > 1:
+            picks = [_pick_point(unit) for unit in run]
+            order = _best_order(run, picks, position)
+            reordered = reordered or order != sorted(order)
+            run[:] = [run[i] for i in order]
+        for unit in run:
+            result.extend(unit)
+        if result and _moves(result):
+            position = _moves(result)[-1]
+        run.clear()
+
+    for unit in _units(pairs):
+        if _pick_point(unit) is not None:
+            run.append(unit)
+            continue
+        flush()
+        result.extend(unit)
+        if _moves(unit):
+            position = _moves(unit)[-1]
+    flush()
+    return result, reordered
+
+
+def optimize_plan(plan):
+    """Shorten a validated flat plan, returning (plan, report)"""
+    pairs = _pairs(plan)
+    optimized, reordered = reorder_units(drop_redundant_moves(pairs))
+    # Reordering can line up new repeats where units meet
+    optimized = drop_redundant_moves(optimized)
+
+    def cost(pairs):
+        points = _moves(pairs)
+        return sum(move_cost(math.dist(a, b)) for a, b in zip(points, points[1:]))
+
+    report = {
+        "moves_removed": len(_moves(pairs)) - len(_moves(optimized)),
+        "reordered": reordered,
+        "travel_before": round(travel(pairs), 3),
+        "travel_after": round(travel(optimized), 3),
+        "cost_saved": cost(pairs) - cost(optimized),
+    }
+    if report["cost_saved"] < 0:
+        # Never hand back something the cost model thinks is slower
+        return list(plan), dict(report, moves_removed=0, reordered=False,
+                                travel_after=report["travel_before"], cost_saved=0)
+
+    stats["plans"] += 1
+    stats["reordered"] += reordered
+    stats["moves_removed"] += report["moves_removed"]
+    stats["cost_saved"] += report["cost_saved"]
+    return _flatten(optimized), report
@@ -0,0 +1,132 @@
+from plan_validation import TOOL_ARGS, parse_literal
+
+
+class PlanParseError(Exception):
+    pass
+
+
+class IncrementalPlanParser:
+    """Pulls complete (tool_name, args) pairs out of a plan list as text streams in
+
+    Expects the flat format the planner prompt asks for:
+    ["move_arm", {"target": [...], ...}, "close_gripper", {}, ...]
+    and also takes ["move_arm", {...}] pairs nested inside the outer list.
+    Like extract_plan, it skips bracketed prose before the plan: a list
+    only counts once its first element is a tool name or a pair.
+    """
+
+    def __init__(self):
+        self._reset()
+        self._finished = False
+
+    def _reset(self):
+        self._started = False
+        self._depth = 0
+        self._quote = None
+        self._escaped = False
+        self._element = []
+        self._pending_name = None
+        # Text since the opening bracket, kept until the list proves to be a plan
+        self._candidate = None
+
+    def feed(self, text):
+        """Consume more text, returning the pairs it completed"""
+        pairs = []
+        while text:
+            text = self._scan(text, pairs)
+        return pairs
+
+    def _scan(self, text, pairs):
+        """Consume text, returning whatever has to be scanned again after a false start"""
+        for i, ch in enumerate(text):
+            if self._finished:
+                break
+            if not self._started:
+                if ch == "[":
+                    self._started = True
+                    self._depth = 1
+                    self._candidate = [ch]
+                continue
+            if self._candidate is not None:
+                self._candidate.append(ch)
+
+            if self._quote:
+                self._element.append(ch)
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == self._quote:
+                    self._quote = None
+                continue
+
+            accepted = True
+            if ch in "\"'":
+                self._quote = ch
+            elif ch in "[{(":
+                self._depth += 1
+            elif ch in "]})":
+                self._depth -= 1
+                if self._depth == 0:
+                    accepted = self._complete_element(pairs) and self._candidate is None
+                    if accepted:
+                        self._finished = True
+                        break
+
+            if accepted and ch == "," and self._depth == 1:
+                accepted = self._complete_element(pairs)
+            elif accepted:
+                self._element.append(ch)
+
+            if not accepted:
+                # Not the plan after all: look for the next list just inside this one
+                rest = "".join(self._candidate[1:]) + text[i + 1:]
+                self._reset()
+                return rest
+        return ""
+
+    def finish(self):
+        """Call once the stream ends; raises if the list never closed"""
+        if not self._finished:
+            raise PlanParseError("Plan list was not terminated")
+        if self._pending_name is not None:
+            raise PlanParseError(
+                f"{self._pending_name} is missing its arguments")
+
+    def _complete_element(self, pairs):
+        """Parse the element just closed, returning False if it shows this isn't a plan"""
+        source = "".join(self._element).strip()
+        self._element = []
+        if not source:
+            return True
+        probation = self._candidate is not None
+        try:
+            value = parse_literal(source)
+        except (ValueError, SyntaxError, TypeError, ZeroDivisionError, RecursionError) as e:
+            if probation:
+                return False
+            raise PlanParseError(f"Could not parse {source!r}: {e}") from e
+
+        if self._pending_name is None:
+            if isinstance(value, (list, tuple)) and len(value) == 2 and isinstance(value[0], str):
+                # A nested ["move_arm", {...}] pair
+                if probation and value[0] not in TOOL_ARGS:
+                    return False
+                if not isinstance(value[1], dict):
+                    raise PlanParseError(
+                        f"Expected arguments for {value[0]}, got {value[1]!r}")
+                pairs.append((value[0], value[1]))
+            elif isinstance(value, str) and (value in TOOL_ARGS or not probation):
+                self._pending_name = value
+            elif probation:
+                return False
+            else:
+                raise PlanParseError(f"Expected a tool name, got {value!r}")
+            self._candidate = None
+        else:
+            if not isinstance(value, dict):
+                raise PlanParseError(
+                    f"Expected arguments for {self._pending_name}, got {value!r}")
+            pairs.append((self._pending_name, value))
+            self._pending_name = None
+        return True
@@ -0,0 +1,189 @@
+import ast
+import math
+import re
+
+# Table surface, matching the geometry given to the planner
+TABLE_HEIGHT = 0.626
+TABLE_MIN_XY = (0.43, -0.95)
+TABLE_MAX_XY = (1.5, 0.55)
+# Highest target the arm can reach comfortably above the table
+MAX_TARGET_Z = 1.6
+# Targets this far off the table are pulled back onto it instead of rejected
+REPAIR_TOLERANCE = 0.05
+
+TOOL_ARGS = {
+    "move_arm": {"target", "target_orn"},
+    "open_gripper": set(),
+    "close_gripper": set(),
+}
+
+
+class PlanValidationError(Exception):
+    pass
+
+
+_NAMES = {"true": True, "false": False, "null": None,
+          "True": True, "False": False, "None": None, "pi": math.pi}
+_BINARY_OPS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+}
+
+
+def _literal(node):
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_literal(elt) for elt in node.elts]
+    if isinstance(node, ast.Dict):
+        return {_literal(k): _literal(v) for k, v in zip(node.keys, node.values)}
+    if isinstance(node, ast.Name) and node.id in _NAMES:
+        return _NAMES[node.id]
+    if isinstance(node, ast.Attribute) and node.attr == "pi" and isinstance(node.value, ast.Name) \
+            and node.value.id in ("math", "np", "numpy"):
+        return math.pi
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _literal(node.operand)
+        if isinstance(value, (int, float)):
+            return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+        left, right = _literal(node.left), _literal(node.right)
+        if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (left, right)):
+            return _BINARY_OPS[type(node.op)](left, right)
+    raise ValueError(f"Unsupported expression: {ast.dump(node)}")
+
+
+def parse_literal(source):
+    """literal_eval that also accepts math.pi arithmetic and JSON literals"""
+    return _literal(ast.parse(source.strip(), mode="eval").body)
+
+
+def _matching_bracket(text, start):
+    depth = 0
+    quote = None
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "[{(":
+            depth += 1
+        elif ch in "]})":
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+
+def _is_pair(value):
+    return isinstance(value, (list, tuple)) and 1 <= len(value) <= 2 \
+        and isinstance(value[0], str) and value[0] in TOOL_ARGS
+
+
+def extract_plan(text):
+    """Find the plan list inside a response that may have prose or code fences around it
+
+    Lists are tried outermost first, so a plan written as nested
+    [name, args] pairs is flattened rather than cut down to its first pair.
+    """
+    for match in re.finditer(r"\[", text):
+        end = _matching_bracket(text, match.start())
+        if end is None:
+            continue
+        try:
+            value = parse_literal(text[match.start():end + 1])
+        except (ValueError, SyntaxError, TypeError, ZeroDivisionError, RecursionError):
+            continue
+        if not isinstance(value, (list, tuple)):
+            continue
+        if any(isinstance(v, str) and v in TOOL_ARGS for v in value):
+            return list(value)
+        if value and all(_is_pair(v) for v in value):
+            return [item for pair in value for item in pair]
+    raise PlanValidationError("No command list found in response")
+
+
+def _vector(value, name, lengths):
+    if not isinstance(value, (list, tuple)) or len(value) not in lengths:
+        raise PlanValidationError(f"{name} must have {' or '.join(map(str, lengths))} numbers, got {value!r}")
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v) for v in value):
+        raise PlanValidationError(f"{name} must be finite numbers, got {value!r}")
+    return [float(v) for v in value]
+
+
+def _clamp(value, low, high, name, repairs):
+    if low <= value <= high:
+        return value
+    if low - REPAIR_TOLERANCE <= value <= high + REPAIR_TOLERANCE:
+        clamped = min(max(value, low), high)
+        repairs.append(f"{name} {value:.3f} clamped to {clamped:.3f}")
+        return clamped
+    raise PlanValidationError(f"{name} {value:.3f} is outside the workspace [{low}, {high}]")
+
+
+def validate_step(tool_name, tool_args, repairs=None):
+    """Check one (tool_name, args) pair, returning normalized args"""
+    repairs = [] if repairs is None else repairs
+    if not isinstance(tool_name, str) or tool_name not in TOOL_ARGS:
+        raise PlanValidationError(f"Unknown tool {tool_name!r}")
+    if tool_args is None:
+        tool_args = {}
+    if not isinstance(tool_args, dict):
+        raise PlanValidationError(f"Arguments for {tool_name} must be a dict, got {tool_args!r}")
+
+    unknown = set(tool_args) - TOOL_ARGS[tool_name]
+    if unknown:
+        repairs.append(f"dropped unknown {tool_name} arguments {sorted(unknown)}")
+    if tool_name != "move_arm":
+        return {}
+
+    if "target" not in tool_args:
+        raise PlanValidationError("move_arm needs a target")
+    x, y, z = _vector(tool_args["target"], "target", (3,))
+    x = _clamp(x, TABLE_MIN_XY[0], TABLE_MAX_XY[0], "target x", repairs)
+    y = _clamp(y, TABLE_MIN_XY[1], TABLE_MAX_XY[1], "target y", repairs)
+    if z < TABLE_HEIGHT:
+        repairs.append(f"target z {z:.3f} raised to the table height")
+        z = TABLE_HEIGHT
+    if z > MAX_TARGET_Z:
+        raise PlanValidationError(f"target z {z:.3f} is above the reachable {MAX_TARGET_Z}")
+
+    args = {"target": [x, y, z]}
+    if tool_args.get("target_orn") is not None:
+        # Euler angles or a quaternion, both accepted by RobotSim.move_arm
+        args["target_orn"] = _vector(tool_args["target_orn"], "target_orn", (3, 4))
+    return args
+
+
+def validate_plan(plan, repairs=None):
+    """Check a flat [name, args, ...] plan before it reaches the robot
+
+    Returns the repaired plan, raising PlanValidationError if it can't be fixed.
+    """
+    repairs = [] if repairs is None else repairs
+    if not isinstance(plan, (list, tuple)) or not plan:
+        raise PlanValidationError("Plan must be a non-empty list")
+
+    validated = []
+    i = 0
+    while i < len(plan):
+        tool_name = plan[i]
+        tool_args = plan[i + 1] if i + 1 < len(plan) else None
+        if isinstance(tool_args, str) or tool_args is None:
+            # A gripper call written without its empty {}
+            repairs.append(f"added missing arguments after {tool_name!r}")
+            i += 1
+            tool_args = None
+        else:
+            i += 2
+        validated += [tool_name, validate_step(tool_name, tool_args, repairs)]
+    return validated
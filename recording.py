@@ -0,0 +1,220 @@
+import logging
+import os
+import threading
+import time
+import uuid
+import numpy as np
+import sounddevice as sd
+
+MAX_RECORDING_SESSIONS = int(os.environ.get("MAX_RECORDING_SESSIONS", "4"))
+# Audio kept per session; older samples are overwritten beyond this
+MAX_RECORDING_SECONDS = float(os.environ.get("MAX_RECORDING_SECONDS", "60"))
+# A session nobody stops ends by itself after this long
+RECORDING_TIMEOUT_SECONDS = float(os.environ.get("RECORDING_TIMEOUT_SECONDS", "300"))
+# Optional sounddevice input device (index or name) for sessions that don't pick one.
+# Each device records for one session at a time, so concurrent sessions need their own
+RECORDING_DEVICE = os.environ.get("RECORDING_DEVICE") or None
+
+logger = logging.getLogger("recording")
+
+
+class RecordingLimitReached(Exception):
+    pass
+
+
+class RecordingSessionError(Exception):
+    pass
+
+
+def input_device(value):
+    """sounddevice takes an int index or a name; environment and JSON give strings"""
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return value
+
+
+class AudioRingBuffer:
+    """Preallocated float32 samples, written by the audio callback without allocating
+
+    Once full, new samples overwrite the oldest ones.
+    """
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError(f"Ring buffer capacity must be positive, got {capacity} "
+                             "(check MAX_RECORDING_SECONDS)")
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self.written = 0
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def write(self, samples):
+        samples = samples[-self.capacity:]
+        start = self.written % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        # Wrap the rest around to the front
+        self._data[:len(samples) - first] = samples[first:]
+        self.written += len(samples)
+
+    def views(self):
+        """The samples in order, as one view or two if the buffer has wrapped; no copies"""
+        if self.written <= self.capacity:
+            return (self._data[:self.written],)
+        start = self.written % self.capacity
+        if start == 0:
+            return (self._data,)
+        return (self._data[start:], self._data[:start])
+
+    def to_array(self):
+        """A single array for Whisper; only copies if the buffer has wrapped"""
+        views = self.views()
+        return views[0] if len(views) == 1 else np.concatenate(views)
+
+
+class RecordingSession:
+    """One operator's microphone capture, with its own buffer and thread"""
+
+    def __init__(self, session_id, samplerate, device=RECORDING_DEVICE,
+                 max_seconds=MAX_RECORDING_SECONDS, timeout=RECORDING_TIMEOUT_SECONDS,
+                 on_end=None):
+        self.session_id = session_id
+        self.samplerate = samplerate
+        self.device = input_device(device)
+        self.timeout = timeout
+        self.on_end = on_end
+        self.buffer = AudioRingBuffer(int(max_seconds * samplerate))
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_recording(self):
+        return self._thread is not None and not self._stop.is_set()
+
+    @property
+    def seconds(self):
+        return len(self.buffer) / self.samplerate
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(
+            target=self._record, name=f"recording-{self.session_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        """Stop capturing and return the recorded audio"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        return self.buffer.to_array()
+
+    def to_dict(self):
+        return {
+            "session_id": self.session_id,
+            "recording": self.is_recording,
+            "started_at": self.started_at,
+            "seconds": round(self.seconds, 2),
+            "overflowed": self.buffer.written > self.buffer.capacity,
+        }
+
+    def _record(self):
+        def callback(indata, frames, time, status):
+            if not self._stop.is_set():
+                # Mono: column 0 is a view, copied straight into the ring
+                self.buffer.write(indata[:, 0])
+
+        try:
+            with sd.InputStream(callback=callback, channels=1, samplerate=self.samplerate,
+                                dtype="float32", device=self.device):
+                if not self._stop.wait(self.timeout):
+                    logger.warning(f"Recording session {self.session_id} stopped after "
+                                   f"{self.timeout:.0f}s without a stop request")
+        except Exception as e:
+            logger.error(f"Recording session {self.session_id} failed: {e}")
+        finally:
+            self._stop.set()
+            if self.on_end:
+                self.on_end(self)
+
+
+class RecordingManager:
+    """Concurrent recording sessions, capped at max_sessions and one per input device
+
+    Callers that don't pass a session id (like the original single-user
+    page) get the only active session. A session that ends by itself (timeout
+    or device error) stops counting against the cap straight away, but its
+    audio can still be collected by the next stop.
+    """
+
+    def __init__(self, samplerate, max_sessions=MAX_RECORDING_SESSIONS, log=print):
+        self.samplerate = samplerate
+        self.max_sessions = max_sessions
+        self.log = log
+        self._sessions = {}
+        # Sessions that ended without a stop request, oldest first
+        self._ended = {}
+        self._lock = threading.Lock()
+
+    def start(self, session_id=None, device=None):
+        device = input_device(device if device is not None else RECORDING_DEVICE)
+        with self._lock:
+            if session_id in self._sessions:
+                raise RecordingSessionError(f"Session {session_id} is already recording")
+            if len(self._sessions) >= self.max_sessions:
+                raise RecordingLimitReached(
+                    f"{len(self._sessions)} recording sessions already active")
+            for other in self._sessions.values():
+                if other.device == device:
+                    raise RecordingSessionError(
+                        f"Input device {device if device is not None else 'default'} "
+                        f"is already recording session {other.session_id}")
+            session = RecordingSession(session_id or uuid.uuid4().hex, self.samplerate,
+                                       device=device, on_end=self._ended_by_itself)
+            self._ended.pop(session.session_id, None)
+            self._sessions[session.session_id] = session
+        session.start()
+        self.log(f"🎤 Recording session {session.session_id} started")
+        return session
+
+    def stop(self, session_id=None):
+        """End a session, returning it with its recorded audio"""
+        with self._lock:
+            if session_id is None:
+                if len(self._sessions) > 1:
+                    raise RecordingSessionError(
+                        f"session_id is required with {len(self._sessions)} active sessions")
+                # The only active session, or else the one that ended most recently
+                session_id = next(iter(self._sessions or reversed(self._ended)), None)
+            session = self._sessions.pop(session_id, None) or self._ended.pop(session_id, None)
+        if session is None:
+            raise RecordingSessionError(f"No active recording session {session_id}")
+        session.stop()
+        self.log(f"⏹️ Recording session {session_id} stopped with {session.seconds:.2f}s of audio")
+        return session
+
+    def _ended_by_itself(self, session):
+        with self._lock:
+            if self._sessions.get(session.session_id) is not session:
+                return
+            del self._sessions[session.session_id]
+            self._ended[session.session_id] = session
+            while len(self._ended) > self.max_sessions:
+                self._ended.pop(next(iter(self._ended)))
+
+    def active(self):
+        with self._lock:
+            return [session.to_dict() for session in self._sessions.values()]
+
+    def stop_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self._ended.clear()
+        for session in sessions:
+            session.stop()
@@ -1,177 +1,447 @@
 import math
+import os
+from collections import OrderedDict
 import numpy as np
 import pybullet_data
 import pybullet as p
 import time
+from scene import SCENE_OBJECTS
+
+# "gui" renders a window, "direct" runs headless as fast as the CPU allows,
+# "shared_memory" attaches to an already running GUI server (pybullet --shared)
+SIM_MODES = {
+    "gui": p.GUI,
+    "direct": p.DIRECT,
+    "shared_memory": p.SHARED_MEMORY,
+}
+DEFAULT_SIM_MODE = os.environ.get("ROBOT_SIM_MODE", "gui")
+
+# move_arm interpolates at most this far per step on the joint that moves most
+MAX_JOINT_STEP = 0.005  # rad
+MIN_MOVE_STEPS = 20
+MAX_MOVE_STEPS = 700
+# Settled once every joint is this close to the IK solution and this slow
+JOINT_TOLERANCE = 0.01  # rad
+VELOCITY_TOLERANCE = 0.05  # rad/s
+SETTLE_TIMEOUT_STEPS = 480  # 2 s of simulated time at 240 Hz
+# Objects closer than this to their last reported position count as unmoved
+SCENE_POSITION_EPSILON = 0.001  # m
+SCENE_JOINT_EPSILON = 0.001  # rad
+GRIPPER_FINGER_JOINTS = [4, 6]
+
+IK_CACHE_SIZE = 512
+# Targets closer than this share an IK solution
+IK_POSITION_RESOLUTION = 0.001  # m
+IK_ORIENTATION_RESOLUTION = 0.001  # quaternion component
+# Planner offsets and the two grasp orientations it chooses between
+HOVER_HEIGHT = 0.25
+LIFT_HEIGHT = 0.3
+GRASP_ORIENTATIONS = [[0, math.pi, math.pi / 2], [0, math.pi, 0]]
+# move_arm targets the fingertips; the end effector link sits this far above
+END_EFFECTOR_OFFSET = 0.25
+
+
+class IKCache:
+    """LRU of IK solutions keyed on quantized position and orientation"""
+
+    def __init__(self, max_entries=IK_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(position, orientation):
+        orientation = list(orientation)
+        # q and -q are the same rotation
+        if next((c for c in orientation if abs(c) > 1e-9), 0) < 0:
+            orientation = [-c for c in orientation]
+        return (tuple(round(v / IK_POSITION_RESOLUTION) for v in position),
+                tuple(round(v / IK_ORIENTATION_RESOLUTION) for v in orientation))
+
+    def get(self, key):
+        solution = self._entries.get(key)
+        if solution is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return solution
+
+    def put(self, key, solution):
+        self._entries[key] = solution
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
 
 
 class RobotSim:
-    def __init__(self):
-        objectspath = "objects/"
-        p.connect(p.GUI)  # or p.GUI for graphical version
-        p.setAdditionalSearchPath(pybullet_data.getDataPath())
-        p.setGravity(0, 0, -10)
-
-        p.loadURDF("plane.urdf")
-        self.kuka_id = p.loadURDF("kuka_iiwa/model_vr_limits.urdf", 1.400000, -
-                                  0.200000, 0.600000, 0.000000, 0.000000, 0.000000, 1.000000)
+    def __init__(self, mode=DEFAULT_SIM_MODE):
+        objectspath = os.path.join(os.path.dirname(
+            os.path.abspath(__file__)), "objects/")
+        if mode not in SIM_MODES:
+            raise ValueError(
+                f"Unknown sim mode {mode!r}, expected one of {sorted(SIM_MODES)}")
+        self.mode = mode
+        self.client = p.connect(SIM_MODES[mode])
+        if self.client < 0:
+            raise RuntimeError(f"Could not connect to pybullet in {mode} mode")
+        cid = self.client
+        self.gui = mode != "direct"
+        if self.gui:
+            # Don't render while the scene is loading
+            p.configureDebugVisualizer(
+                p.COV_ENABLE_RENDERING, 0, physicsClientId=cid)
+        else:
+            # Step only when we ask, as fast as the CPU allows
+            p.setRealTimeSimulation(0, physicsClientId=cid)
+        p.setAdditionalSearchPath(
+            pybullet_data.getDataPath(), physicsClientId=cid)
+        p.setGravity(0, 0, -10, physicsClientId=cid)
+
+        p.loadURDF("plane.urdf", physicsClientId=cid)
+        self.kuka_id = p.loadURDF("kuka_iiwa/model_vr_limits.urdf", [1.4, -0.2, 0.6], [0, 0, 0, 1],
+                                  physicsClientId=cid)
         self.kuka_gripper_id = p.loadSDF(
-            "gripper/wsg50_one_motor_gripper_new_free_base.sdf")[0]
+            "gripper/wsg50_one_motor_gripper_new_free_base.sdf", physicsClientId=cid)[0]
         # Friction on the gripper fingers (assuming gripper has multiple links)
-        for i in range(p.getNumJoints(self.kuka_gripper_id)):
+        for i in range(p.getNumJoints(self.kuka_gripper_id, physicsClientId=cid)):
             p.changeDynamics(self.kuka_gripper_id, i,
                              lateralFriction=0.9,   # Moderate friction
-                             spinningFriction=0.07)
+                             spinningFriction=0.07,
+                             physicsClientId=cid)
         table_id = p.loadURDF(
-            "table/table.urdf", basePosition=[1.0, -0.2, 0.0], baseOrientation=[0, 0, 0.7071, 0.7071])
+            "table/table.urdf", basePosition=[1.0, -0.2, 0.0], baseOrientation=[0, 0, 0.7071, 0.7071],
+            physicsClientId=cid)
         # Set friction for the table
         p.changeDynamics(table_id, -1, lateralFriction=0.8,
-                         spinningFriction=0.1, rollingFriction=0.01)
-
-        apple_pos = [0.8, -0.3, 0.6849899910813102]
-        p.loadURDF(objectspath + "apple.urdf",
-                   basePosition=apple_pos, globalScaling=0.03)
-
-        bottle_pos = [0.7, 0.1, 0.8]
-        bottle_id = p.loadURDF(objectspath + "bottle.urdf",
-                               basePosition=bottle_pos, globalScaling=0.05)
-        # Add a little friction to the bottle
-        p.changeDynamics(bottle_id, -1,  # -1 applies to all links
-                         lateralFriction=0.5,      # Small amount of friction
-                         spinningFriction=0.02,    # Very light spinning friction
-                         rollingFriction=0.01)     # Very light rolling friction
-
-        box_pos = [1, 0.1, 0.7]
-        box_id = p.loadURDF(objectspath + "box.urdf",
-                            basePosition=box_pos, globalScaling=0.05)
-
-        banana_pos = [0.893, 0.313, 0.660]
-        banana_orn = [0.997, 0.000, 0.030, -0.073]
-        banana_id = p.loadURDF(objectspath + "banana.urdf", basePosition=banana_pos,
-                               baseOrientation=banana_orn, globalScaling=0.035)
-        p.changeDynamics(banana_id, -1,  # -1 applies to all links
-                         lateralFriction=0.5,      # Small amount of friction
-                         spinningFriction=0.02,    # Very light spinning friction
-                         rollingFriction=0.01)     # Very light rolling friction
-
-        container_pos = [0.9, -0.75, 0.73]
-        container_id = p.loadURDF(objectspath + "container.urdf",
-                                  basePosition=container_pos, globalScaling=0.05)
-
-        hammer_pos = [1, -0.2, 0.7]
-        hammer_orn = p.getQuaternionFromEuler(
-            [math.pi/2, -math.pi/2, math.pi])  # Lay flat
-        hammer_id = p.loadURDF(objectspath + "hammer.urdf",
-                               basePosition=hammer_pos,
-                               baseOrientation=hammer_orn,
-                               globalScaling=0.05)
+                         spinningFriction=0.1, rollingFriction=0.01,
+                         physicsClientId=cid)
+
+        self.objects = {}
+        self.object_specs = {}
+        for spec in SCENE_OBJECTS:
+            if "orientation_euler" in spec:
+                orn = p.getQuaternionFromEuler(spec["orientation_euler"])
+            else:
+                orn = spec.get("orientation", [0, 0, 0, 1])
+            body_id = p.loadURDF(objectspath + spec["urdf"], basePosition=spec["position"],
+                                 baseOrientation=orn, globalScaling=spec["scale"],
+                                 physicsClientId=cid)
+            if "dynamics" in spec:
+                p.changeDynamics(body_id, -1, physicsClientId=cid,  # -1 applies to all links
+                                 **spec["dynamics"])
+            self.objects[spec["Object"]] = body_id
+            self.object_specs[spec["Object"]] = spec
 
         # attach gripper to kuka arm
         p.createConstraint(self.kuka_id, 6, self.kuka_gripper_id, 0, p.JOINT_FIXED, [
-            0, 0, 0], [0, 0, 0.05], [0, 0, 0])
+            0, 0, 0], [0, 0, 0.05], [0, 0, 0], physicsClientId=cid)
         kuka_cid2 = p.createConstraint(self.kuka_gripper_id, 4, self.kuka_gripper_id, 6, jointType=p.JOINT_GEAR, jointAxis=[
-            1, 1, 1], parentFramePosition=[0, 0, 0], childFramePosition=[0, 0, 0])
+            1, 1, 1], parentFramePosition=[0, 0, 0], childFramePosition=[0, 0, 0], physicsClientId=cid)
         p.changeConstraint(kuka_cid2, gearRatio=-1, erp=0.5,
-                           relativePositionTarget=0, maxForce=100)
+                           relativePositionTarget=0, maxForce=100, physicsClientId=cid)
 
         # reset kuka
         jointPositions = [-0.000000, -0.000000, 0.000000,
                           1.570793, 0.000000, -1.036725, 0.000001]
-        for jointIndex in range(p.getNumJoints(self.kuka_id)):
+        for jointIndex in range(p.getNumJoints(self.kuka_id, physicsClientId=cid)):
             p.resetJointState(self.kuka_id, jointIndex,
-                              jointPositions[jointIndex])
+                              jointPositions[jointIndex], physicsClientId=cid)
             p.setJointMotorControl2(self.kuka_id, jointIndex,
-                                    p.POSITION_CONTROL, jointPositions[jointIndex], 0)
+                                    p.POSITION_CONTROL, jointPositions[jointIndex], 0,
+                                    physicsClientId=cid)
 
         # reset gripper
         p.resetBasePositionAndOrientation(self.kuka_gripper_id, [
-            0.923103, -0.200000, 1.250036], [-0.000000, 0.964531, -0.000002, -0.263970])
+            0.923103, -0.200000, 1.250036], [-0.000000, 0.964531, -0.000002, -0.263970],
+            physicsClientId=cid)
         jointPositions = [0.000000, -0.011130, -0.206421,
                           0.205143, -0.009999, 0.000000, -0.010055, 0.000000]
-        for jointIndex in range(p.getNumJoints(self.kuka_gripper_id)):
+        for jointIndex in range(p.getNumJoints(self.kuka_gripper_id, physicsClientId=cid)):
             p.resetJointState(self.kuka_gripper_id, jointIndex,
-                              jointPositions[jointIndex])
+                              jointPositions[jointIndex], physicsClientId=cid)
             p.setJointMotorControl2(self.kuka_gripper_id, jointIndex,
-                                    p.POSITION_CONTROL, jointPositions[jointIndex], 0)
+                                    p.POSITION_CONTROL, jointPositions[jointIndex], 0,
+                                    physicsClientId=cid)
 
-        self.num_joints = p.getNumJoints(self.kuka_id)
+        self.num_joints = p.getNumJoints(self.kuka_id, physicsClientId=cid)
+        self.joint_indices = list(range(self.num_joints))
         self.kuka_end_effector_idx = 6
 
-        # Reset camera view
-        p.resetDebugVisualizerCamera(
-            cameraDistance=2.2,
-            cameraYaw=223,
-            cameraPitch=-38,
-            cameraTargetPosition=[1, -0.5, 0.0]
-        )
+        # Per-move and cumulative control loop counters
+        self.last_move = None
+        self.stats = {"moves": 0, "steps": 0,
+                      "pybullet_calls": 0, "seconds": 0.0}
+
+        self.ik_cache = IKCache()
+        self.precompute_approach_poses()
+
+        # Cached scene state, recomputed only after something may have moved
+        self.scene_version = 0
+        self._scene_state = None
+        self._scene_dirty = True
+
+        # In-memory snapshot of the freshly loaded scene, so a reset doesn't reload anything
+        self.checkpoints = {}
+        self.initial_state = p.saveState(physicsClientId=cid)
+
+        if self.gui:
+            # Reset camera view
+            p.resetDebugVisualizerCamera(
+                cameraDistance=2.2,
+                cameraYaw=223,
+                cameraPitch=-38,
+                cameraTargetPosition=[1, -0.5, 0.0],
+                physicsClientId=cid
+            )
+            p.configureDebugVisualizer(
+                p.COV_ENABLE_RENDERING, 1, physicsClientId=cid)
 
     def move_arm(self, target_pos, target_orn=None):
-        target_pos[2] += 0.25
-        steps = 700
+        """Move the gripper above target_pos, returning whether the arm converged
+
+        The step count scales with the largest joint displacement, then the arm
+        settles until joint error and velocity are within tolerance or the
+        settle timeout runs out.
+        """
+        target_pos = list(target_pos)
+        target_pos[2] += END_EFFECTOR_OFFSET
         if target_orn is None:
             target_orn = p.getQuaternionFromEuler([0, math.pi, 0])
         elif isinstance(target_orn, list) and len(target_orn) == 3:
             target_orn = p.getQuaternionFromEuler(target_orn)
 
-        target_joint_poses = p.calculateInverseKinematics(
-            self.kuka_id, self.kuka_end_effector_idx, target_pos, target_orn)
+        start_time = time.perf_counter()
+        target_joint_poses, calls = self.solve_ik(target_pos, target_orn)
 
         # Get current joint positions
-        current_joint_poses = [p.getJointState(
-            self.kuka_id, j)[0] for j in range(self.num_joints)]
-
-        for t in range(steps):
-            frac = t / steps
-            interp_poses = [
-                (1 - frac) * current + frac * target
-                for current, target in zip(current_joint_poses, target_joint_poses)
-            ]
-
-            for j in range(self.num_joints):
-                p.setJointMotorControl2(
-                    bodyIndex=self.kuka_id,
-                    jointIndex=j,
-                    controlMode=p.POSITION_CONTROL,
-                    targetPosition=interp_poses[j]
-                )
-
-            p.stepSimulation()
+        current_joint_poses = self._arm_state()[0]
+        calls += 1
 
-    def open_gripper(self):
-        steps = 100
-        current_pos = p.getJointState(self.kuka_gripper_id, 4)[
-            0]
+        distance = np.max(np.abs(target_joint_poses - current_joint_poses))
+        steps = min(MAX_MOVE_STEPS, max(
+            MIN_MOVE_STEPS, math.ceil(distance / MAX_JOINT_STEP)))
 
-        for t in range(steps):
-            frac = t / steps
-            interp_pos = (1 - frac) * current_pos + frac * 0.0
+        # Whole trajectory up front, one row of joint targets per step
+        trajectory = np.linspace(
+            current_joint_poses, target_joint_poses, steps + 1)[1:]
+        for interp_poses in trajectory:
+            p.setJointMotorControlArray(
+                self.kuka_id, self.joint_indices, p.POSITION_CONTROL,
+                targetPositions=interp_poses, physicsClientId=self.client)
+            p.stepSimulation(physicsClientId=self.client)
+        calls += 2 * steps
 
-            p.setJointMotorControl2(
-                self.kuka_gripper_id, 4, p.POSITION_CONTROL, targetPosition=interp_pos, force=100)
-            p.setJointMotorControl2(
-                self.kuka_gripper_id, 6, p.POSITION_CONTROL, targetPosition=interp_pos, force=100)
+        # Hold the final pose until the joints have actually arrived
+        settle_steps = 0
+        while True:
+            positions, velocities = self._arm_state()
+            calls += 1
+            error = float(np.max(np.abs(positions - target_joint_poses)))
+            velocity = float(np.max(np.abs(velocities)))
+            converged = error < JOINT_TOLERANCE and velocity < VELOCITY_TOLERANCE
+            if converged or settle_steps >= SETTLE_TIMEOUT_STEPS:
+                break
+            p.stepSimulation(physicsClientId=self.client)
+            calls += 1
+            settle_steps += 1
 
-            p.stepSimulation()
+        result = self._record_move(
+            "move_arm", steps + settle_steps, calls, start_time)
+        result.update(converged=converged, joint_error=error)
+        return result
+
+    def solve_ik(self, target_pos, target_orn):
+        """Joint positions for an end effector pose, returning (poses, solver calls)"""
+        key = IKCache.key(target_pos, target_orn)
+        solution = self.ik_cache.get(key)
+        if solution is not None:
+            return solution, 0
+        solution = np.asarray(p.calculateInverseKinematics(
+            self.kuka_id, self.kuka_end_effector_idx, target_pos, target_orn,
+            physicsClientId=self.client)[:self.num_joints])
+        self.ik_cache.put(key, solution)
+        return solution, 1
+
+    def precompute_approach_poses(self):
+        """Solve IK for the hover, grasp and lift poses of every object up front"""
+        for name, body_id in self.objects.items():
+            x, y, z = p.getBasePositionAndOrientation(
+                body_id, physicsClientId=self.client)[0]
+            if name == "container":
+                heights = [z + LIFT_HEIGHT]
+            else:
+                heights = [z, z + HOVER_HEIGHT, z + LIFT_HEIGHT]
+            for euler in GRASP_ORIENTATIONS:
+                orn = p.getQuaternionFromEuler(euler)
+                for height in heights:
+                    self.solve_ik([x, y, height + END_EFFECTOR_OFFSET], orn)
+        # Precomputed entries shouldn't count as cache misses
+        self.ik_cache.misses = 0
+
+    def object_positions(self):
+        return {name: list(p.getBasePositionAndOrientation(body_id, physicsClientId=self.client)[0])
+                for name, body_id in self.objects.items()}
+
+    def scene_state(self):
+        """Object locations, bounding boxes and arm joints, with a version that bumps when anything moves"""
+        if not self._scene_dirty and self._scene_state is not None:
+            return self._scene_state
+
+        objects = []
+        for name, body_id in self.objects.items():
+            position = p.getBasePositionAndOrientation(
+                body_id, physicsClientId=self.client)[0]
+            aabb_min, aabb_max = p.getAABB(body_id, physicsClientId=self.client)
+            spec = self.object_specs[name]
+            objects.append({
+                "Object": name,
+                "location": [round(v, 4) for v in position],
+                "x": spec["x"],
+                "y": spec["y"],
+                "aabb": [[round(v, 3) for v in aabb_min], [round(v, 3) for v in aabb_max]],
+            })
+
+        arm = {"joints": [round(float(v), 4) for v in self._arm_state()[0]]}
+
+        if self._scene_state is None or self._scene_moved(objects, arm):
+            self.scene_version += 1
+            self._scene_state = {"version": self.scene_version, "objects": objects, "arm": arm}
+        self._scene_dirty = False
+        return self._scene_state
+
+    def _scene_moved(self, objects, arm):
+        previous = {obj["Object"]: obj["location"]
+                    for obj in self._scene_state["objects"]}
+        if any(math.dist(previous[obj["Object"]], obj["location"]) > SCENE_POSITION_EPSILON
+               for obj in objects):
+            return True
+        # The arm moving on its own still changes where the next plan starts from
+        return any(abs(a - b) > SCENE_JOINT_EPSILON
+                   for a, b in zip(self._scene_state["arm"]["joints"], arm["joints"]))
+
+    def place_objects(self, positions):
+        """Teleport objects to the given positions, keeping their orientation"""
+        for name, position in positions.items():
+            body_id = self.objects[name]
+            orn = p.getBasePositionAndOrientation(
+                body_id, physicsClientId=self.client)[1]
+            p.resetBasePositionAndOrientation(
+                body_id, position, orn, physicsClientId=self.client)
+        self._scene_dirty = True
+
+    def object_in_container(self, name, margin=0.02):
+        """Whether an object's base sits inside the container, between its floor and the top of its walls"""
+        container = self.objects["container"]
+        # The base link is only the floor slab; the walls are separate links
+        (x0, y0, z0), (x1, y1, z1) = p.getAABB(container, physicsClientId=self.client)
+        for link in range(p.getNumJoints(container, physicsClientId=self.client)):
+            z1 = max(z1, p.getAABB(container, link, physicsClientId=self.client)[1][2])
+        x, y, z = p.getBasePositionAndOrientation(
+            self.objects[name], physicsClientId=self.client)[0]
+        return (x0 + margin <= x <= x1 - margin and y0 + margin <= y <= y1 - margin
+                and z0 - margin <= z <= z1 + margin)
+
+    def set_arm_joints(self, joints, settle_steps=60):
+        """Put the arm at the given joint positions, such as the live robot's, and hold it there"""
+        for index, position in zip(self.joint_indices, joints):
+            p.resetJointState(self.kuka_id, index, position, physicsClientId=self.client)
+        self._hold_current_pose()
+        # The gripper hangs off a constraint and needs a few steps to catch up
+        for _ in range(settle_steps):
+            p.stepSimulation(physicsClientId=self.client)
+        self._scene_dirty = True
+
+    def settle(self, steps=240):
+        for _ in range(steps):
+            p.stepSimulation(physicsClientId=self.client)
+        self._scene_dirty = True
+
+    def save_checkpoint(self, name):
+        """Snapshot the current world under a name reset() can return to"""
+        if name in self.checkpoints:
+            p.removeState(self.checkpoints[name], physicsClientId=self.client)
+        self.checkpoints[name] = p.saveState(physicsClientId=self.client)
+
+    def reset(self, checkpoint=None):
+        """Restore the initial scene, or a named checkpoint"""
+        if checkpoint is None:
+            state = self.initial_state
+        elif checkpoint in self.checkpoints:
+            state = self.checkpoints[checkpoint]
+        else:
+            raise ValueError(f"Unknown checkpoint {checkpoint!r}")
+        p.restoreState(stateId=state, physicsClientId=self.client)
+        self._hold_current_pose()
+        self._scene_dirty = True
+
+    def _hold_current_pose(self):
+        # restoreState doesn't touch motor targets, which would drag the joints back
+        positions = self._arm_state()[0]
+        p.setJointMotorControlArray(
+            self.kuka_id, self.joint_indices, p.POSITION_CONTROL,
+            targetPositions=positions, physicsClientId=self.client)
+        fingers = [state[0] for state in p.getJointStates(
+            self.kuka_gripper_id, GRIPPER_FINGER_JOINTS, physicsClientId=self.client)]
+        p.setJointMotorControlArray(
+            self.kuka_gripper_id, GRIPPER_FINGER_JOINTS, p.POSITION_CONTROL,
+            targetPositions=fingers, forces=[100, 100], physicsClientId=self.client)
+
+    def open_gripper(self):
+        return self._move_gripper("open_gripper", 0.0)
 
     def close_gripper(self):
+        return self._move_gripper("close_gripper", 0.05)
+
+    def _move_gripper(self, name, target):
         steps = 100
-        current_pos = p.getJointState(self.kuka_gripper_id, 4)[
+        start_time = time.perf_counter()
+        current_pos = p.getJointState(self.kuka_gripper_id, 4, physicsClientId=self.client)[
             0]
 
-        for t in range(steps):
-            frac = t / steps
-            interp_pos = (1 - frac) * current_pos + frac * 0.05
+        trajectory = np.linspace(current_pos, target, steps, endpoint=False)
+        for interp_pos in trajectory:
+            # Both finger joints in one call
+            p.setJointMotorControlArray(
+                self.kuka_gripper_id, GRIPPER_FINGER_JOINTS, p.POSITION_CONTROL,
+                targetPositions=[interp_pos, interp_pos], forces=[100, 100],
+                physicsClientId=self.client)
+            p.stepSimulation(physicsClientId=self.client)
+
+        return self._record_move(name, steps, 1 + 2 * steps, start_time)
+
+    def _arm_state(self):
+        states = p.getJointStates(
+            self.kuka_id, self.joint_indices, physicsClientId=self.client)
+        return (np.array([state[0] for state in states]),
+                np.array([state[1] for state in states]))
 
-            p.setJointMotorControl2(
-                self.kuka_gripper_id, 4, p.POSITION_CONTROL, targetPosition=interp_pos, force=100)
-            p.setJointMotorControl2(
-                self.kuka_gripper_id, 6, p.POSITION_CONTROL, targetPosition=interp_pos, force=100)
+    def _record_move(self, name, steps, calls, start_time):
+        seconds = time.perf_counter() - start_time
+        self._scene_dirty = True
+        self.last_move = {
+            "command": name,
+            "steps": steps,
+            "pybullet_calls": calls,
+            "seconds": seconds,
+        }
+        self.stats["moves"] += 1
+        self.stats["steps"] += steps
+        self.stats["pybullet_calls"] += calls
+        self.stats["seconds"] += seconds
+        return dict(self.last_move)
 
-            p.stepSimulation()
+    def disconnect(self):
+        p.disconnect(physicsClientId=self.client)
 
 
 if __name__ == "__main__":
     sim = RobotSim()
     while True:
-        p.stepSimulation()
-        time.sleep(1. / 240.)  # match PyBullet's default timestep
+        p.stepSimulation(physicsClientId=sim.client)
+        if sim.gui:
+            time.sleep(1. / 240.)  # match PyBullet's default timestep
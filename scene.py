@@ -0,0 +1,108 @@
+import json
+import math
+import threading
+
+# Single description of the objects on the table: RobotSim loads them from here
+# and planners fall back to it when the live scene state is unavailable.
+# "x"/"y" say which side of the object is short enough to grasp across.
+SCENE_OBJECTS = [
+    {
+        "Object": "apple",
+        "urdf": "apple.urdf",
+        "position": [0.8, -0.3, 0.6849899910813102],
+        "scale": 0.03,
+        "x": "short",
+        "y": "short",
+    },
+    {
+        "Object": "bottle",
+        "urdf": "bottle.urdf",
+        "position": [0.7, 0.1, 0.8],
+        "scale": 0.05,
+        # Add a little friction to the bottle
+        "dynamics": {"lateralFriction": 0.5, "spinningFriction": 0.02, "rollingFriction": 0.01},
+        "x": "short",
+        "y": "short",
+    },
+    {
+        "Object": "box",
+        "urdf": "box.urdf",
+        "position": [1, 0.1, 0.7],
+        "scale": 0.05,
+        "x": "long",
+        "y": "short",
+    },
+    {
+        "Object": "banana",
+        "urdf": "banana.urdf",
+        "position": [0.893, 0.313, 0.660],
+        "orientation": [0.997, 0.000, 0.030, -0.073],
+        "scale": 0.035,
+        "dynamics": {"lateralFriction": 0.5, "spinningFriction": 0.02, "rollingFriction": 0.01},
+        "x": "long",
+        "y": "short",
+    },
+    {
+        "Object": "container",
+        "urdf": "container.urdf",
+        "position": [0.9, -0.75, 0.73],
+        "scale": 0.05,
+        "x": "long",
+        "y": "long",
+    },
+    {
+        "Object": "hammer",
+        "urdf": "hammer.urdf",
+        "position": [1, -0.2, 0.7],
+        "orientation_euler": [math.pi / 2, -math.pi / 2, math.pi],  # Lay flat
+        "scale": 0.05,
+        "x": "short",
+        "y": "long",
+    },
+]
+
+DEFAULT_SCENE = [
+    {"Object": obj["Object"], "location": list(obj["position"]), "x": obj["x"], "y": obj["y"]}
+    for obj in SCENE_OBJECTS
+]
+
+
+class SceneStateCache:
+    """Client-side copy of the robot's scene state, refreshed only when it may have changed
+
+    fetch(known_version) returns the server's scene state as JSON, or just
+    {"version": n, "unchanged": true} when known_version is still current.
+    """
+
+    def __init__(self, fetch, fallback=DEFAULT_SCENE, log=print):
+        self.fetch = fetch
+        self.fallback = fallback
+        self.log = log
+        self.version = None
+        self.objects = None
+        self.arm = None
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Call after anything that may have moved objects"""
+        self._dirty = True
+
+    def get(self):
+        with self._lock:
+            if self._dirty or self.objects is None:
+                try:
+                    state = json.loads(self.fetch(self.version))
+                    if not state.get("unchanged"):
+                        self.objects = state["objects"]
+                        self.arm = state.get("arm")
+                        self.version = state["version"]
+                    self._dirty = False
+                except Exception as e:
+                    fallback = "last known" if self.objects is not None else "default scene"
+                    self.log(f"⚠️ Scene state unavailable, using the {fallback}: {e}")
+            return self.objects if self.objects is not None else self.fallback
+
+    def arm_joints(self):
+        """The arm's joint positions from the last fetch, or None if unknown"""
+        return (self.arm or {}).get("joints")
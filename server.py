@@ -6,41 +6,103 @@
 #   server.py
 # Lastly click on the url with the authenticaiton key already on there
 
+# Pick the simulator with ROBOT_SIM_MODE=gui|direct|shared_memory (default gui);
+# use direct on headless machines
+
 from mcp.server.fastmcp import FastMCP
-from robot_controller import RobotSim
+from robot_controller import DEFAULT_SIM_MODE, RobotSim
+from tracing import span
+import json
+import logging
 import os
-os.environ["DISPLAY"] = ":0"
+import sys
+
+SIM_MODE = os.environ.get("ROBOT_SIM_MODE", DEFAULT_SIM_MODE)
+if SIM_MODE != "direct":
+    os.environ.setdefault("DISPLAY", ":0")
+
+# stdout carries the MCP protocol, so spans and logs go to stderr
+logging.basicConfig(stream=sys.stderr, level=logging.INFO, format="%(message)s")
 
-# Create an MCP server
+# Create an MCP server; tools take an optional trace_parent so their spans
+# join the caller's trace
 mcp = FastMCP("Demo")
-sim = RobotSim()
+sim = RobotSim(mode=SIM_MODE)
 
 
 # Add an addition tool
 @mcp.tool()
-def add(a: int, b: int) -> int:
+def add(a: int, b: int, trace_parent: str | None = None) -> int:
     """Add two numbers"""
     return a + b
 
 
 @mcp.tool()
-def move_arm(target, target_orn=None):
-    sim.move_arm(target, target_orn)
+def move_arm(target, target_orn=None, trace_parent: str | None = None):
+    with span("sim:move_arm", parent=trace_parent):
+        result = sim.move_arm(target, target_orn)
+    if not result["converged"]:
+        return (f"Arm did not converge to {target} with orientation {target_orn} "
+                f"(joint error {result['joint_error']:.3f} rad after {result['steps']} steps)")
     return f"Arm moved to {target} with orientation {target_orn}"
 
 
 @mcp.tool()
-def open_gripper():
-    sim.open_gripper()
+def open_gripper(trace_parent: str | None = None):
+    with span("sim:open_gripper", parent=trace_parent):
+        sim.open_gripper()
     return "Gripper opened"
 
 
 @mcp.tool()
-def close_gripper():
-    sim.close_gripper()
+def close_gripper(trace_parent: str | None = None):
+    with span("sim:close_gripper", parent=trace_parent):
+        sim.close_gripper()
     return "Gripper closed"
 
 
+@mcp.tool()
+def reset_scene(checkpoint: str | None = None, trace_parent: str | None = None) -> str:
+    """Return the world to the initial scene, or to a saved checkpoint"""
+    with span("sim:reset_scene", parent=trace_parent):
+        sim.reset(checkpoint)
+    return f"Scene reset to {checkpoint or 'initial state'}"
+
+
+@mcp.tool()
+def save_checkpoint(name: str, trace_parent: str | None = None) -> str:
+    """Snapshot the current world so reset_scene can return to it"""
+    with span("sim:save_checkpoint", parent=trace_parent):
+        sim.save_checkpoint(name)
+    return f"Checkpoint {name} saved"
+
+
+@mcp.tool()
+def get_sim_stats(trace_parent: str | None = None) -> dict:
+    """Step, pybullet call and wall-clock counters for the last and all moves"""
+    return {
+        "last_move": sim.last_move,
+        "totals": sim.stats,
+        "ik_cache": {"entries": len(sim.ik_cache), "hits": sim.ik_cache.hits, "misses": sim.ik_cache.misses},
+    }
+
+
+@mcp.tool()
+def get_scene_state(known_version: int | None = None, trace_parent: str | None = None) -> str:
+    """Live object locations, AABBs and arm joints; just the version if known_version is current"""
+    with span("sim:get_scene_state", parent=trace_parent):
+        state = sim.scene_state()
+    if known_version == state["version"]:
+        return json.dumps({"version": state["version"], "unchanged": True})
+    return json.dumps(state)
+
+
+@mcp.resource("scene://state")
+def scene_state() -> str:
+    """Live object locations, AABBs and arm joints with a version counter"""
+    return json.dumps(sim.scene_state())
+
+
 # Add a dynamic greeting resource
 @mcp.resource("greeting://{name}")
 def get_greeting(name: str) -> str:
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("anthropic")
+import LLMPipeline  # noqa: E402
+from plan_validation import PlanValidationError  # noqa: E402
+
+
+def test_flatten_steps():
+    steps = [{"tool": "move_arm", "target": [0.9, 0.3, 0.7]}, {"tool": "close_gripper"}]
+    assert LLMPipeline._flatten_steps(steps) == [
+        "move_arm", {"target": [0.9, 0.3, 0.7]}, "close_gripper", {}]
+
+
+@pytest.mark.parametrize("steps", [
+    "move_arm",
+    [["move_arm", {}]],
+    [{"target": [0.9, 0.3, 0.7]}],
+    [{"tool": "wave"}],
+])
+def test_flatten_steps_rejects_malformed_steps(steps):
+    with pytest.raises(PlanValidationError):
+        LLMPipeline._flatten_steps(steps)
@@ -0,0 +1,39 @@
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("pybullet")
+pytest.importorskip("mcp")
+from mcp_pool import RobotSessionPool  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def pool():
+    os.environ.setdefault("ROBOT_SIM_MODE", "direct")
+    pool = RobotSessionPool(log=lambda message: None)
+    pool.start()
+    deadline = time.monotonic() + 30
+    while not pool.is_healthy() and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert pool.is_healthy()
+    yield pool
+    pool.close()
+
+
+def test_read_tool_does_not_wait_for_running_plan(pool):
+    plan = []
+    for i in range(60):
+        plan += ["move_arm", {"target": [0.9, 0.3 - 0.1 * (i % 7), 0.9]}]
+    running = pool.submit(plan)
+    time.sleep(0.3)
+
+    state = json.loads(pool.read_tool("get_scene_state", timeout=2))
+
+    assert not running.done()
+    assert {"version", "objects", "arm"} <= set(state)
+    running.result(120)
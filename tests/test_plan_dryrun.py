@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("pybullet")
+import fast_planner  # noqa: E402
+import plan_dryrun  # noqa: E402
+from scene import DEFAULT_SCENE  # noqa: E402
+
+
+@pytest.fixture(scope="module", autouse=True)
+def worker_sim():
+    plan_dryrun._init_worker()
+
+
+def test_dry_run_delivers_a_fast_path_plan():
+    plan = fast_planner.plan_locally(DEFAULT_SCENE, "put the banana in the container")
+    positions = {obj["Object"]: obj["location"] for obj in DEFAULT_SCENE}
+    outcome = plan_dryrun._dry_run(plan, ["banana"], positions)
+    assert outcome["delivered"] == 1
+
+
+def test_score_prefers_converged_plans():
+    base = {"delivered": 1, "targets": 1, "disturbance": 0.0, "steps": 100}
+    converged = dict(base, converged=True, steps=200)
+    stuck = dict(base, converged=False)
+    assert plan_dryrun._score(converged) < plan_dryrun._score(stuck)
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("pybullet")
+from robot_controller import RobotSim  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def sim():
+    return RobotSim(mode="direct")
+
+
+def test_direct_sim_loads_scene(sim):
+    assert {"container", "banana", "apple"} <= set(sim.objects)
+    joints, _ = sim._arm_state()
+    assert len(joints) == len(sim.joint_indices)
+
+
+def test_move_arm_converges(sim):
+    sim.reset()
+    result = sim.move_arm([1.0, -0.2, 0.9])
+    assert result["converged"]
+
+
+def test_object_in_container_counts_the_tray(sim):
+    sim.reset()
+    x, y, _ = sim.object_positions()["container"]
+    sim.place_objects({"banana": [x, y, 0.72]})
+    sim.settle()
+    assert sim.object_in_container("banana")
+    assert not sim.object_in_container("apple")
+
+
+def test_set_arm_joints_carries_the_gripper(sim):
+    sim.reset()
+    sim.move_arm([1.2, 0.2, 0.9])
+    joints = sim._arm_state()[0]
+    other = RobotSim(mode="direct")
+    other.set_arm_joints(joints)
+    assert max(abs(a - b) for a, b in zip(other._arm_state()[0], joints)) < 0.01
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tracing  # noqa: E402
+
+
+def test_label_values_are_escaped():
+    registry = tracing.MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests")
+    counter.inc(endpoint='say "hi"\\\n')
+    assert 'requests_total{endpoint="say \\"hi\\"\\\\\\n"} 1' in registry.render()
+
+
+def test_dict_gauge_renders_kind_labels():
+    registry = tracing.MetricsRegistry()
+    registry.gauge("queue_depth", "Queued jobs", lambda: {"asr": 2, 'l"lm': 1})
+    lines = registry.render().splitlines()
+    assert "# TYPE queue_depth gauge" in lines
+    assert 'queue_depth{kind="asr"} 2' in lines
+    assert 'queue_depth{kind="l\\"lm"} 1' in lines
+
+
+def test_span_records_errors():
+    with pytest.raises(RuntimeError):
+        with tracing.span("test:failing") as current:
+            raise RuntimeError("boom")
+    assert current.error == "RuntimeError"
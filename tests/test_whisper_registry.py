@@ -0,0 +1,36 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from whisper_registry import WhisperRegistry  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fake_whisper(monkeypatch):
+    # The real package downloads checkpoints; the registry only needs load_model
+    monkeypatch.setitem(sys.modules, "whisper", types.SimpleNamespace(
+        load_model=lambda size: types.SimpleNamespace(
+            transcribe=lambda audio, **kwargs: {"text": size})))
+
+
+def test_warm_up_marks_ready():
+    registry = WhisperRegistry(default_size="base")
+    assert not registry.is_ready()
+    registry.warm_up()
+    assert registry.is_ready()
+
+
+def test_first_transcription_marks_ready():
+    registry = WhisperRegistry(default_size="base")
+    assert registry.transcribe(None) == {"text": "base"}
+    assert registry.is_ready()
+
+
+def test_other_sizes_do_not_mark_ready():
+    registry = WhisperRegistry(default_size="base")
+    registry.transcribe(None, size="tiny")
+    assert not registry.is_ready()
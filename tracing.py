@@ -0,0 +1,208 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger("trace")
+
+# Seconds; covers a fast-path plan up to a slow two-call LLM plan
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape_label(value):
+    # The text format reads backslash, double quote and newline as escapes
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_format_labels(key)} {value}"
+                      for key, value in sorted(self._values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # Per label set: one count per bucket plus +Inf, then the sum
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics rendered in the Prometheus text format
+
+    Gauges and counter_from() counters are read at scrape time from
+    callables, so existing stats dicts can be exposed without being rewritten.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._read = []
+
+    def counter(self, name, help):
+        metric = Counter(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, read):
+        """read() returns a number or a {label value: number} dict keyed on the "kind" label"""
+        self._read.append((name, help, "gauge", read))
+
+    def counter_from(self, name, help, read):
+        """Like gauge(), for a value that only ever goes up; name should end in _total"""
+        self._read.append((name, help, "counter", read))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for name, help, kind, read in self._read:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            value = read()
+            if isinstance(value, dict):
+                lines += [f"{name}{_format_labels([('kind', label)])} {v}"
+                          for label, v in sorted(value.items())]
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram(
+    "pipeline_stage_seconds", "Time spent in each traced pipeline stage")
+stage_errors = metrics.counter(
+    "pipeline_stage_errors_total", "Traced stages that raised")
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attrs):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def to_dict(self):
+        record = {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                  "name": self.name, "duration_ms": round(self.duration * 1000, 3)}
+        if self.error:
+            record["error"] = self.error
+        if self.attrs:
+            record["attrs"] = self.attrs
+        return record
+
+
+def current_trace_id():
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+def trace_parent():
+    """The current span as "<trace_id>-<span_id>", for carrying across a process boundary"""
+    span = _current_span.get()
+    return f"{span.trace_id}-{span.span_id}" if span else None
+
+
+@contextmanager
+def attach(parent):
+    """Continue a trace_parent() string in another thread or event loop without recording a span"""
+    if not parent:
+        yield
+        return
+    trace_id, _, span_id = parent.partition("-")
+    remote = Span("remote", trace_id, None, {})
+    remote.span_id = span_id
+    token = _current_span.set(remote)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name, parent=None, **attrs):
+    """Time a stage, nested under the current span or under a trace_parent() string
+
+    Each finished span is logged as one JSON line and observed in the
+    pipeline_stage_seconds histogram.
+    """
+    if parent:
+        trace_id, _, parent_id = parent.partition("-")
+    else:
+        local = _current_span.get()
+        trace_id = local.trace_id if local else uuid.uuid4().hex
+        parent_id = local.span_id if local else None
+    current = Span(name, trace_id, parent_id or None, attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        stage_errors.inc(stage=name)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.duration = time.perf_counter() - current.start
+        stage_seconds.observe(current.duration, stage=name)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(current.to_dict(), default=str))
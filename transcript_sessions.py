@@ -0,0 +1,116 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# A partial transcript is "stable" once it repeats unchanged this many times
+STABLE_PARTIAL_REPEATS = 2
+MIN_SPECULATION_WORDS = 3
+SESSION_IDLE_SECONDS = 300
+
+
+def normalize_transcript(text):
+    return re.sub(r"[^a-z0-9 ]+", "", " ".join(text.lower().split())).strip()
+
+
+class TranscriptSession:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.segments = {}
+        self.order = []
+        self.last_text = ""
+        self.repeats = 0
+        self.speculative_text = None
+        self.speculative_plan = None
+        self.updated_at = time.monotonic()
+
+    def add_chunk(self, chunk_id, transcript):
+        # Partial results for the same chunk id replace each other
+        if chunk_id not in self.segments:
+            self.order.append(chunk_id)
+        self.segments[chunk_id] = transcript
+        self.updated_at = time.monotonic()
+
+        text = self.text()
+        if normalize_transcript(text) == normalize_transcript(self.last_text):
+            self.repeats += 1
+        else:
+            self.repeats = 0
+        self.last_text = text
+        return text
+
+    def text(self):
+        return " ".join(self.segments[i].strip() for i in self.order if self.segments[i].strip())
+
+    def is_stable(self):
+        return (self.repeats + 1 >= STABLE_PARTIAL_REPEATS
+                and len(normalize_transcript(self.last_text).split()) >= MIN_SPECULATION_WORDS)
+
+
+class TranscriptAggregator:
+    """Aggregates streamed transcript chunks and plans speculatively on stable partials"""
+
+    def __init__(self, plan_fn, execute_fn, max_workers=4):
+        self.plan_fn = plan_fn
+        self.execute_fn = execute_fn
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="transcript-plan")
+        self.stats = {"speculations": 0, "reused": 0, "cancelled": 0}
+
+    def receive(self, session_id, chunk_id, transcript, is_final):
+        with self._lock:
+            self._expire_idle()
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = TranscriptSession(
+                    session_id)
+            text = session.add_chunk(chunk_id, transcript)
+
+            if not is_final:
+                speculating = False
+                if session.is_stable() and session.speculative_text != normalize_transcript(text):
+                    self._speculate(session, text)
+                    speculating = True
+                return {'text': text, 'speculating': speculating}
+
+            # Final transcript: reuse the in-flight plan if it was planned on the same words
+            del self.sessions[session_id]
+            if session.speculative_plan is not None and session.speculative_text == normalize_transcript(text):
+                self.stats["reused"] += 1
+                plan_future = session.speculative_plan
+                plan_status = 'reused'
+            else:
+                self._cancel(session)
+                plan_future = self._executor.submit(self.plan_fn, text)
+                plan_status = 'started'
+
+            self._executor.submit(self._execute_when_planned, plan_future)
+            return {'text': text, 'plan': plan_status}
+
+    def _speculate(self, session, text):
+        self._cancel(session)
+        session.speculative_text = normalize_transcript(text)
+        session.speculative_plan = self._executor.submit(self.plan_fn, text)
+        self.stats["speculations"] += 1
+
+    def _cancel(self, session):
+        if session.speculative_plan is not None:
+            # A plan already running can't be interrupted; its result is simply dropped
+            session.speculative_plan.cancel()
+            session.speculative_plan = None
+            session.speculative_text = None
+            self.stats["cancelled"] += 1
+
+    def _execute_when_planned(self, plan_future):
+        plan = plan_future.result()
+        if plan:
+            self.execute_fn(plan)
+
+    def _expire_idle(self):
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if now - session.updated_at > SESSION_IDLE_SECONDS:
+                self._cancel(session)
+                del self.sessions[session_id]
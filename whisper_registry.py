@@ -0,0 +1,112 @@
+import os
+import threading
+import warnings
+from collections import OrderedDict
+
+# Suppress the FP16 warning
+warnings.filterwarnings(
+    "ignore", message="FP16 is not supported on CPU; using FP32 instead")
+
+DEFAULT_MODEL_SIZE = os.environ.get("WHISPER_MODEL", "base")
+MEMORY_BUDGET_MB = int(os.environ.get("WHISPER_MEMORY_BUDGET_MB", "2048"))
+
+# Approximate resident size of each checkpoint, used for the memory budget
+MODEL_MEMORY_MB = {
+    "tiny": 150,
+    "tiny.en": 150,
+    "base": 300,
+    "base.en": 300,
+    "small": 1000,
+    "small.en": 1000,
+    "medium": 3000,
+    "medium.en": 3000,
+    "large": 6000,
+    "turbo": 3200,
+}
+
+
+class _LoadedModel:
+    def __init__(self, size, model):
+        self.size = size
+        self.model = model
+        self.memory_mb = MODEL_MEMORY_MB.get(size, MODEL_MEMORY_MB["large"])
+        # Whisper models are not safe to run from several threads at once
+        self.lock = threading.Lock()
+
+
+class WhisperRegistry:
+    """Keeps Whisper models resident so requests don't reload weights"""
+
+    def __init__(self, default_size=DEFAULT_MODEL_SIZE, memory_budget_mb=MEMORY_BUDGET_MB):
+        self.default_size = default_size
+        self.memory_budget_mb = memory_budget_mb
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._ready = threading.Event()
+
+    def warm_up(self):
+        """Load the default model size ahead of the first transcription"""
+        self._get(self.default_size)
+
+    def warm_up_async(self):
+        thread = threading.Thread(target=self.warm_up, daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self):
+        """Whether the default model has been loaded, by warm_up or a request"""
+        return self._ready.is_set()
+
+    def loaded_sizes(self):
+        with self._lock:
+            return list(self._models.keys())
+
+    def transcribe(self, audio, size=None, **kwargs):
+        """Run inference on a resident model, one call per model at a time"""
+        entry = self._get(size or self.default_size)
+        with entry.lock:
+            return entry.model.transcribe(audio, **kwargs)
+
+    def _get(self, size):
+        while True:
+            with self._lock:
+                entry = self._models.get(size)
+                if entry is not None:
+                    self._models.move_to_end(size)
+                    return entry
+                loading = self._loading.get(size)
+                if loading is None:
+                    loading = self._loading[size] = threading.Event()
+                    break
+            # Another thread is already loading this size
+            loading.wait()
+
+        try:
+            # Import whisper here to avoid circular import
+            import whisper
+            entry = _LoadedModel(size, whisper.load_model(size))
+            with self._lock:
+                self._models[size] = entry
+                self._evict(keep=size)
+            if size == self.default_size:
+                self._ready.set()
+            return entry
+        finally:
+            with self._lock:
+                del self._loading[size]
+            loading.set()
+
+    def _evict(self, keep):
+        """Drop least recently used models until we fit the memory budget"""
+        total = sum(entry.memory_mb for entry in self._models.values())
+        for size in list(self._models.keys()):
+            if total <= self.memory_budget_mb:
+                break
+            if size == keep:
+                continue
+            # In-flight transcriptions keep their own reference to the model
+            total -= self._models.pop(size).memory_mb
+
+
+registry = WhisperRegistry()